@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import datetime
+import io
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from ja import frontend
+from ja.native import NinjaNativeFrontend, elide_middle
+
+def varint(value):
+	out = bytearray()
+	while True:
+		byte = value & 0x7f
+		value >>= 7
+		if value:
+			out.append(byte | 0x80)
+		else:
+			out.append(byte)
+			return bytes(out)
+
+WARNING = '\x1b[01m\x1b[K../src/file{0}.cpp:12:9:\x1b[m\x1b[K \x1b[01;35m\x1b[Kwarning: \x1b[m\x1b[K' \
+          'unused variable \u2018x\u2019 [\x1b[01;35m\x1b[K-Wunused-variable\x1b[m\x1b[K]\n'
+
+def synthetic_messages(status_class, edges, parallelism=128, output_size=0, output_every=100):
+	"""Yields the length-delimited messages of a build of edges compile commands, parallelism of
+	them running at the same time. Every output_every-th edge prints output_size bytes of warnings.
+	"""
+	def encode(msg):
+		data = msg.SerializeToString()
+		return varint(len(data)) + data
+
+	msg = status_class()
+	msg.total_edges.total_edges = edges
+	yield encode(msg)
+	msg = status_class()
+	msg.build_started.parallelism = parallelism
+	yield encode(msg)
+	for i in range(edges + parallelism):
+		if i >= parallelism:
+			finished = i - parallelism
+			msg = status_class()
+			msg.edge_finished.id = finished
+			msg.edge_finished.end_time = i
+			if output_size > 0 and finished % output_every == 0:
+				warning = WARNING.format(finished)
+				msg.edge_finished.output = (warning * (output_size // len(warning) + 1))[:output_size]
+			yield encode(msg)
+		if i < edges:
+			msg = status_class()
+			msg.edge_started.id = i
+			msg.edge_started.start_time = i
+			msg.edge_started.desc = 'Building CXX object src/CMakeFiles/foo.dir/file{}.cpp.o'.format(i)
+			msg.edge_started.command = '/usr/bin/c++ -O2 -c ../src/file{0}.cpp -o file{0}.cpp.o'.format(i)
+			msg.edge_started.inputs.append('../src/file{}.cpp'.format(i))
+			msg.edge_started.outputs.append('src/file{}.cpp.o'.format(i))
+			yield encode(msg)
+	msg = status_class()
+	msg.build_finished.SetInParent()
+	yield encode(msg)
+
+def synthetic_stream(status_class, edges):
+	return b''.join(synthetic_messages(status_class, edges))
+
+def bench_reader(data, chunk_size):
+	start = time.perf_counter()
+	count = 0
+	for _ in frontend.Frontend(io.BytesIO(data), chunk_size=chunk_size):
+		count += 1
+	elapsed = time.perf_counter() - start
+	print('chunk size {:>6}: {:>8} messages in {:.3f}s, {:>10.0f} messages/s, {:6.1f} MB/s'.format(
+		chunk_size, count, elapsed, count / elapsed, len(data) / elapsed / 1e6))
+
+def legacy_format_progress_status(self, fmt):
+	"""NinjaNativeFrontend.format_progress_status before $NINJA_STATUS was compiled."""
+	import humanize
+	out = ''
+	fmt_iter = iter(fmt)
+	for c in fmt_iter:
+		if c == '%':
+			c = next(fmt_iter)
+			if c == '%':
+				out += c
+			elif c == 's':
+				out += str(self.started_edges)
+			elif c == 't':
+				out += str(self.total_edges)
+			elif c == 'r':
+				out += str(self.running_edges)
+			elif c == 'u':
+				out += str(self.total_edges - self.started_edges)
+			elif c == 'f':
+				out += str(self.finished_edges)
+			elif c == 'o':
+				if self.time_millis > 0:
+					rate = self.finished_edges / (self.time_millis / 1e3)
+					out += '{:.1f}'.format(rate)
+				else:
+					out += '?'
+			elif c == 'c':
+				self.current_rate.update_rate(self.finished_edges, self.time_millis)
+				if self.current_rate.rate == -1:
+					out += '?'
+				else:
+					out += '{:.1f}'.format(self.current_rate.rate)
+			elif c == 'p':
+				out += '{:3d}%'.format((100 * self.finished_edges) // self.total_edges)
+			elif c == 'e':
+				out += '{:.3f}'.format(self.time_millis / 1e3)
+			elif c == 'a':
+				if self.finished_edges > 0:
+					out += 'ETA: ' + humanize.naturaldelta(
+						datetime.timedelta(seconds=self.time_millis / self.finished_edges * \
+						(self.total_edges - self.finished_edges) / 1e3)
+					)
+				else:
+					out += '{} jobs'.format(self.total_edges)
+			else:
+				raise Exception('unknown placeholder '' + c +'' in $NINJA_STATUS')
+		else:
+			out += c
+	out = '{:17}'.format(out)
+	bar_end = round((len(out) * self.finished_edges) / self.total_edges)
+	return '\x1b[0;36m▕\x1b[1;37;46m' + out[:bar_end] + '\x1b[0m\x1b[1m' + out[bar_end:] + \
+	       '\x1b[0;36m▏\x1b[0m'
+
+def bench_progress_status(fmt, updates=100000):
+	os.environ['NINJA_STATUS'] = fmt
+	native = NinjaNativeFrontend()
+	native.total_edges = updates
+	for name, format_status in (
+		('legacy', lambda: legacy_format_progress_status(native, fmt)),
+		('compiled', native.format_progress_status),
+	):
+		native.current_rate.times.clear()
+		start = time.perf_counter()
+		for i in range(1, updates + 1):
+			native.started_edges = native.finished_edges = i
+			native.time_millis = i * 10
+			format_status()
+		elapsed = time.perf_counter() - start
+		print('NINJA_STATUS={!r:30} {:>8}: {:>10.0f} updates/s'.format(fmt, name, updates / elapsed))
+
+legacy_ansi_escape = re.compile(r'\x1b[^m]*m')
+def legacy_elide_middle(status, width):
+	"""elide_middle before it became linear in the number of escape codes."""
+	margin = 1 # Space for "…".
+	status_stripped = legacy_ansi_escape.sub('', status)
+	if len(status_stripped) + margin > width:
+		elide_size = (width - margin) // 2
+
+		escapes = []
+		added_len = 0 # total number of characters
+		for m in legacy_ansi_escape.finditer(status):
+			escapes += [(m.start() - added_len, m.group())]
+			added_len += len(m.group())
+
+		status = status_stripped[0:elide_size] + "…" + status_stripped[-elide_size:]
+
+		added_len = 0
+		# We need to put all ANSI escape codes back in:
+		for escape in escapes:
+			pos = escape[0]
+			if pos > elide_size:
+				pos -= len(status_stripped) - width
+				if pos < width - elide_size:
+					pos = width - elide_size
+			pos += added_len
+			status = status[:pos] + escape[1] + status[pos:]
+			added_len += len(escape[1])
+	return status
+
+def bench_elide_middle(words, colored, repeat=2000):
+	status = ' '.join(
+		'\x1b[1;3{}m-Iinclude/dir{}\x1b[0m'.format(i % 8, i) if colored else '-Iinclude/dir{}'.format(i)
+		for i in range(words)
+	)
+	for name, elide in (('legacy', legacy_elide_middle), ('linear', elide_middle)):
+		start = time.perf_counter()
+		for _ in range(repeat):
+			elide(status, 120)
+		elapsed = time.perf_counter() - start
+		print('elide {:>5} words, {:>5}: {:>8}: {:>10.0f} lines/s'.format(
+			words, 'color' if colored else 'plain', name, repeat / elapsed))
+
+if __name__ == '__main__':
+	edges = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+	data = synthetic_stream(frontend.Frontend(io.BytesIO()).status_class, edges)
+	for chunk_size in (1, 64, 4096, frontend.CHUNK_SIZE):
+		bench_reader(data, chunk_size)
+	for fmt in (' %a ', '[%f/%t] ', '[%p %s/%t %r %o/s %c/s %e] '):
+		bench_progress_status(fmt)
+	for words in (10, 100, 1000):
+		for colored in (False, True):
+			bench_elide_middle(words, colored)
@@ -0,0 +1,199 @@
+"""Attaching to a build which a previous ja left running in the background.
+
+ja exits on the first failure while ninja keeps running. Before it exits, it forks a relay which
+keeps reading the status stream of ninja and listens on ATTACH_SOCKET in the build directory. A
+ja which waits for the build directory connects to it and receives the state of the build (the
+counters and the running edges) followed by the rest of the stream, so that it can show its
+progress. The relay inherits the lock on the build directory and exits with ninja.
+"""
+
+import json
+import os
+import select
+import signal
+import socket
+
+from ja import ninja
+
+ATTACH_SOCKET = 'ja.attach'
+
+class BuildRelay(object):
+    def __init__(self, status_stream, native, ninja_pid, lock):
+        self.status_stream = status_stream
+        self.native = native
+        self.ninja_pid = ninja_pid
+        self.lock = lock
+        self.record = status_stream.record
+        self.clients = []
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.remove(ATTACH_SOCKET) # left behind by a relay which has been killed
+        except FileNotFoundError:
+            pass
+        self.sock.bind(ATTACH_SOCKET)
+        self.sock.listen(4)
+
+    def run(self):
+        native = self.native
+        # Nobody sees the output anymore, the trace has been closed and the report won't be
+        # printed. Only the history is still of use:
+        native.printer.smart_terminal = False
+        native.trace = None
+        native.report = None
+        self.status_stream.idle = self.wait_for_input
+        self.status_stream.record = self
+        try:
+            for msg in self.status_stream:
+                native.handle(msg)
+        finally:
+            # The stream ends when ninja exits, so don't let the next ja wait for its PID:
+            self.lock.set_ninja_pids([])
+            native.build_stopped()
+            self.sock.close()
+            try:
+                os.remove(ATTACH_SOCKET)
+            except FileNotFoundError:
+                pass
+
+    def wait_for_input(self, reader):
+        """Accepts clients until ninja sends more messages. Called when every message received so
+        far has been handled, so that the state of native matches the stream.
+        """
+        reader_fd = reader.fileno()
+        while True:
+            readable = select.select([reader_fd, self.sock] + self.clients, [], [])[0]
+            for client in self.clients[:]:
+                if client in readable and not client.recv(64):
+                    self.drop(client)
+            if self.sock in readable:
+                client = self.sock.accept()[0]
+                try:
+                    client.sendall(self.snapshot())
+                    self.clients.append(client)
+                except OSError:
+                    client.close()
+            if reader_fd in readable:
+                return
+
+    def snapshot(self):
+        """The state of the build as a JSON line, followed by EdgeStarted messages for the running
+        edges and the incomplete message at the end of the stream received so far.
+        """
+        from ja import frontend
+        native = self.native
+        state = {
+            'ninja_pid': self.ninja_pid,
+            'total_edges': native.total_edges,
+            'started_edges': native.started_edges - len(native.running),
+            'finished_edges': native.finished_edges,
+            'time_millis': native.time_millis,
+            'parallelism': native.parallelism,
+            'verbose': native.verbose,
+        }
+        chunks = [json.dumps(state).encode(), b'\n']
+        status_class = frontend.status_class()
+        for edge in native.running.values():
+            msg = status_class()
+            msg.edge_started.id = edge.id
+            msg.edge_started.start_time = edge.start_time
+            msg.edge_started.desc = edge.desc
+            msg.edge_started.command = edge.command
+            msg.edge_started.console = edge.console
+            if edge.output:
+                msg.edge_started.outputs.append(edge.output)
+            data = msg.SerializeToString()
+            chunks.append(encode_varint(len(data)))
+            chunks.append(data)
+        chunks.append(bytes(self.status_stream.buffer))
+        return b''.join(chunks)
+
+    def write(self, chunk):
+        """Called by Frontend with every chunk of the stream."""
+        if self.record is not None:
+            self.record.write(chunk)
+        for client in self.clients[:]:
+            try:
+                client.sendall(chunk)
+            except OSError:
+                self.drop(client)
+
+    def drop(self, client):
+        self.clients.remove(client)
+        client.close()
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def detach(status_stream, native, ninja_pid, lock):
+    """Forks a BuildRelay for the rest of the build, which takes over the ticket of lock. Returns
+    in the parent."""
+    if os.fork() != 0:
+        return
+    exit_code = 1
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.close(devnull)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        BuildRelay(status_stream, native, ninja_pid, lock).run()
+        exit_code = 0
+    finally:
+        os._exit(exit_code)
+
+def attach(native, cancel=False):
+    """Shows the progress of a build left running in the background by a previous ja using
+    native, until it has finished. Ctrl+C or cancel=True cancel it instead. Returns False if
+    there's no such build.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(ATTACH_SOCKET)
+    except OSError:
+        sock.close()
+        return False
+    reader = sock.makefile('rb', buffering=0)
+    try:
+        line = reader.readline()
+        if not line.endswith(b'\n'):
+            return False # the build has just finished
+        state = json.loads(line.decode())
+        ninja_pid = state['ninja_pid']
+
+        if cancel:
+            ninja.cancel(ninja_pid)
+            native.printer.print_line('\x1b[1;36mcancelling the build still running in the '
+                                      'background\x1b[0m', native.printer.LINE_FULL)
+        else:
+            native.printer.print_line('\x1b[1;36mninja is still running the previous build in the '
+                                      'background, press Ctrl+C to cancel it:\x1b[0m',
+                                      native.printer.LINE_FULL)
+            native.total_edges = state['total_edges']
+            native.started_edges = state['started_edges']
+            native.finished_edges = state['finished_edges']
+            native.time_millis = state['time_millis']
+            native.parallelism = max(state['parallelism'], 1)
+            native.verbose = state['verbose']
+
+            from ja import frontend
+            try:
+                for msg in frontend.Frontend(reader, idle=native.wait_for_input):
+                    native.handle(msg)
+                return True
+            except KeyboardInterrupt:
+                ninja.cancel(ninja_pid)
+                native.printer.print_on_new_line('\x1b[1;36mcancelling the build still running in '
+                                                 'the background\x1b[0m\n')
+
+        while reader.read(65536):
+            pass # until ninja has stopped
+        return True
+    finally:
+        reader.close()
+        sock.close()
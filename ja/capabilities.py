@@ -0,0 +1,89 @@
+"""Cached probe of what the installed ninja supports.
+
+Running `ninja --help` costs a fork and exec on every invocation of ja. The result only changes
+when the ninja binary changes, so it's cached per binary under the user's cache directory, keyed
+by the resolved path, size and modification time of the binary.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import zlib
+
+from ja.store import write_atomically
+
+def cache_dir():
+    """Returns ja's directory below $XDG_CACHE_HOME, creating it if necessary."""
+    path = os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'ja')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class NinjaCapabilities(object):
+    def __init__(self, path, version, flags):
+        self.path = path
+        self.version = version
+        self.flags = flags
+
+    def supports(self, flag):
+        return flag in self.flags
+
+    def version_at_least(self, *version):
+        """E.g. version_at_least(1, 13) for ninja 1.13.0 or 1.13.0.git."""
+        parts = []
+        for part in self.version.split('.'):
+            if not part.isdigit():
+                break
+            parts.append(int(part))
+        return tuple(parts) >= version
+
+def parse_flags(help_text):
+    """Returns the options listed in `ninja --help`, e.g. {'-v', '--verbose', '--frontend'}."""
+    flags = set()
+    for line in help_text.splitlines():
+        line = line.strip()
+        if line.startswith('-'):
+            # "-v, --verbose  show all command lines while building"
+            for option in line.split('  ')[0].split(', '):
+                flags.add(option.split(' ')[0])
+    return flags
+
+def run_ninja(path, arg):
+    proc = subprocess.run([path, arg], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return proc.stdout.decode('utf-8', 'replace')
+
+def probe_ninja(refresh=False):
+    """Returns the NinjaCapabilities of the ninja on $PATH.
+
+    Raises FileNotFoundError if there's no ninja. refresh=True ignores and rewrites the cache.
+    """
+    path = shutil.which('ninja')
+    if path is None:
+        raise FileNotFoundError('ninja')
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    key = [path, stat.st_size, stat.st_mtime_ns]
+
+    try:
+        cache_file = os.path.join(cache_dir(), 'ninja-{:08x}.json'.format(
+            zlib.crc32(path.encode())))
+    except OSError:
+        cache_file = None # no writable cache directory, probe every time
+
+    if cache_file and not refresh:
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+            if cached['key'] == key:
+                return NinjaCapabilities(path, cached['version'], set(cached['flags']))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    version = run_ninja(path, '--version').strip()
+    flags = parse_flags(run_ninja(path, '--help'))
+    if cache_file:
+        # If two ja processes probe at the same time, the last one wins and both results are equal
+        # anyway:
+        write_atomically(cache_file, lambda f: json.dump(
+            {'key': key, 'version': version, 'flags': sorted(flags)}, f), 'w')
+    return NinjaCapabilities(path, version, flags)
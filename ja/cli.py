@@ -0,0 +1,369 @@
+"""Command line interface of ja, run in-process or by a ja server (see ja/server.py)."""
+
+import atexit
+import signal
+import subprocess
+import os
+import enum
+import shlex
+
+import click
+from ja import start_time
+from ja.log import log, StartupProfile
+from ja.capabilities import probe_ninja
+
+profile = StartupProfile(start_time)
+
+def run(cmd, verbose, env=None):
+    if not verbose:
+        cmd += " &>/dev/null"
+    log('$ ' + cmd, verbose)
+    try:
+        subprocess.check_call(cmd, shell=True, env=env)
+    except subprocess.CalledProcessError as err:
+        raise err
+
+class BuildSystem(enum.Enum):
+    MESON = 0
+    CMAKE = 1
+
+@click.command(help="""Frontend for ninja focusing on a faster edit, compile, debug cycle.\n
+If TARGETS are unspecified, builds the 'default' target (see manual).""")
+@click.version_option(version='1.1.3') # also see setup.py
+@click.option('-j', metavar='N', required=False, type=int,
+              help='Run N jobs in parallel. [default=as many as fit into the available memory '
+                   'according to previous builds, at most ninja\'s default]')
+@click.option('-t', metavar='TOOL', required=False,
+              help='Run a subtool (use -t list to list subtools).')
+@click.option('-C', metavar='DIR', required=False,
+              help='Change to DIR before doing anything else.')
+@click.option('-f', metavar='FILE', default='build.ninja',
+              help='Specify input build file. [default=build.ninja]')
+@click.option('-v', help='Show all command lines while building.', is_flag=True)
+@click.option('--release',
+              help='Build release configuration when using CMake\'s Ninja Multi-Config.',
+              is_flag=True)
+@click.option('--configs', metavar='CONFIGS', required=False,
+              help='Build several configurations of CMake\'s Ninja Multi-Config at the same time, '
+                   'e.g. Debug,Release.')
+@click.option('--refresh-rate', metavar='HZ', required=False, type=float,
+              help='Redraw the status line at most HZ times per second, 0 redraws on every '
+                   'update. [default=30]')
+@click.option('--output-lines', metavar='N', required=False, type=click.IntRange(min=0),
+              help='Show at most N lines of the output of a job, the full output is written to '
+                   'a log file in the build directory. 0 shows everything. [default=200]')
+@click.option('--slow-timeout', metavar='SECONDS', required=False, type=click.FloatRange(min=0),
+              help='Highlight jobs which run for longer than SECONDS. Jobs which take much longer '
+                   'than in previous builds are always highlighted.')
+@click.option('--trace', metavar='FILE', required=False, type=click.Path(dir_okay=False),
+              help='Write a Chrome trace event file of the build, e.g. for ui.perfetto.dev.')
+@click.option('--record', metavar='FILE', required=False, type=click.Path(dir_okay=False),
+              help='Save the status stream of ninja to FILE, e.g. to replay it with replay.py.')
+@click.option('--no-compiler-cache', is_flag=True,
+              help="Don't configure new build directories with ccache or sccache and don't report "
+                   'their hits.')
+@click.option('--cmake-profile', metavar='FILE', required=False, type=click.Path(dir_okay=False),
+              help='When configuring a CMake project, write a Chrome trace event file of its CMake '
+                   'code to FILE (needs CMake 3.18).')
+@click.option('--report', is_flag=True,
+              help='Print the critical path and how well jobs were parallelized after the build.')
+@click.option('--analyze-rebuilds', is_flag=True,
+              help='Print which inputs cost the most build time when modified, according to this '
+                   'and previous builds with this option.')
+@click.option('--watch', is_flag=True,
+              help='Keep running and rebuild whenever a source file of TARGETS changes (Linux '
+                   'only).')
+@click.option('--cancel', is_flag=True,
+              help='Cancel a build which a previous ja left running in the background instead of '
+                   'showing its progress.')
+@click.option('--startup-profile', help='Print how long each startup phase of ja took.',
+              is_flag=True)
+@click.option('--refresh-ninja-caps', is_flag=True,
+              help='Probe which features ninja supports again instead of using the cached result.')
+@click.argument('targets', nargs=-1)
+def main(j, t, c, f, v, release, configs, refresh_rate, output_lines, slow_timeout, trace, record,
+         no_compiler_cache, cmake_profile, report, analyze_rebuilds, watch, cancel, startup_profile,
+         refresh_ninja_caps, targets):
+    if startup_profile:
+        profile.enabled = True
+        profile.mark('imports')
+        atexit.register(profile.report)
+
+    # Relative to the directory ja was started in:
+    if trace:
+        trace = os.path.abspath(trace)
+    if record:
+        record = os.path.abspath(record)
+    if cmake_profile:
+        cmake_profile = os.path.abspath(cmake_profile)
+    if configs:
+        from ja.configs import parse_configs
+        configs = parse_configs(configs)
+        for option, name in ((watch, '--watch'), (record, '--record')):
+            if option:
+                click.secho("{} can't be combined with --configs.".format(name), fg='red')
+                exit(1)
+    # Targets which are source files, e.g. `ja src/main.cpp`:
+    source_paths = {target: os.path.realpath(target) for target in targets
+                    if os.path.isfile(target)}
+
+    try:
+        ninja_caps = probe_ninja(refresh_ninja_caps)
+    except FileNotFoundError:
+        click.secho("Couldn't find ninja command. Please make sure it's on your PATH.", fg='red')
+        exit(1)
+    profile.mark('ninja capabilities')
+
+    try:
+        build_system = None
+        build_dir = c or 'build'
+        if not os.path.exists(os.path.join(c, f) if c else f):
+            old_cwd = os.getcwd()
+            if not c and os.listdir('.') == []: # Current directory empty?
+                build_dir = '.'
+                os.chdir('..')
+
+            if os.path.exists('CMakeLists.txt'):
+                build_system = BuildSystem.CMAKE
+                import logging
+                logging.debug('found CMakeLists.txt')
+            elif os.path.exists('meson.build'):
+                build_system = BuildSystem.MESON
+                import logging
+                logging.debug('found meson.build')
+
+            os.chdir(old_cwd)
+
+        if build_system is not None:
+            if os.path.isfile(build_dir):
+                click.secho("Can't create directory '{}' because a file with that name exists."
+                            .format(build_dir), fg='red')
+                exit(1)
+
+        default_env = dict(os.environ)
+        default_env['LANG'] = 'C.utf-8'
+        if not 'CMAKE_EXPORT_COMPILE_COMMANDS' in default_env:
+            default_env['CMAKE_EXPORT_COMPILE_COMMANDS'] = '1'
+
+        if build_system is not None:
+            if not os.path.exists(os.path.join(build_dir, f)):
+                if build_system == BuildSystem.MESON:
+                    meson_env = None
+                    if no_compiler_cache:
+                        # Meson only uses ccache and sccache on its own if CC and CXX aren't set:
+                        meson_env = dict(os.environ)
+                        meson_env.setdefault('CC', 'cc')
+                        meson_env.setdefault('CXX', 'c++')
+                    run('meson {}'.format(build_dir), True, env=meson_env)
+                elif build_system == BuildSystem.CMAKE:
+                    from ja.cmake import run_cmake
+                    cmake_argv = ['-B{}'.format(build_dir), '-G', 'Ninja Multi-Config']
+                    if not no_compiler_cache:
+                        from ja import compiler_cache
+                        tool = compiler_cache.find_tool()
+                        if tool is not None:
+                            cmake_argv += compiler_cache.cmake_args(tool)
+                    run_cmake(cmake_argv, v, build_dir=build_dir, profiling_output=cmake_profile)
+            c = build_dir
+
+        if c:
+            try:
+                log('$ cd ' + c, v)
+                os.chdir(c)
+            except FileNotFoundError as err:
+                click.secho(str(err), fg='red', bold=True)
+                exit(1)
+
+        profile.mark('build directory setup')
+
+        if t:
+            profile.report()
+            os.execl('/bin/sh', 'sh', '-c', 'ninja -t ' + t)
+        if release and f == 'build.ninja':
+            f = 'build-Release.ninja'
+        if source_paths and not configs: # MultiConfigBuild maps them for each configuration
+            from ja.sources import map_sources
+            targets = map_sources(targets, source_paths, f)
+            profile.mark('mapping source files to targets')
+        watch_targets = targets
+        # Jobs to run in parallel, None for ninja's default:
+        parallelism = j
+        if j:
+            targets += ('-j{}'.format(j),)
+        if v:
+            targets += ('-v',)
+
+        from ja.native import NinjaNativeFrontend
+        from ja.history import DurationHistory
+        history = DurationHistory()
+        try:
+            native = NinjaNativeFrontend(refresh_rate, history)
+            if output_lines is not None:
+                native.max_output_lines = output_lines
+            if slow_timeout is not None:
+                native.slow_timeout = int(slow_timeout * 1000)
+            if trace:
+                from ja.trace import TraceWriter
+                native.trace = TraceWriter(open(trace, 'w'))
+            if report:
+                from ja.report import BuildReport
+                native.report = BuildReport()
+        except ValueError as err:
+            click.secho(str(err), fg='red')
+            exit(1)
+        profile.mark('NinjaNativeFrontend setup')
+
+        # Only allow one running instance per build directory:
+        from ja.lock import BuildDirectoryLock
+        lock = BuildDirectoryLock()
+        def waiting(reason):
+            from ja.attach import attach
+            if not attach(NinjaNativeFrontend(refresh_rate, printer=native.printer), cancel):
+                print("\x1b[1;36mwaiting for {}\x1b[0m".format(reason))
+        lock.acquire(waiting)
+        profile.mark('waiting for build directory lock')
+        history.load() # after the previous build has saved it
+        if analyze_rebuilds:
+            from ja.rebuilds import InputIndex
+            native.rebuilds = InputIndex()
+            if not native.rebuilds.load():
+                native.rebuilds.import_ninja_deps(f, history)
+                native.rebuilds.save()
+            profile.mark('loading input index')
+        fallback_to_ninja = not ninja_caps.supports('--frontend')
+        if not j and not fallback_to_ninja and os.path.isdir('/proc'):
+            # Don't run more jobs than fit into memory:
+            from ja.memory import MemoryHistory, MemorySampler, planned_outputs
+            native.memory = MemorySampler(MemoryHistory())
+            native.memory.history.load()
+            def planned():
+                if not configs:
+                    return planned_outputs(f, targets, default_env)
+                from ja.sources import map_sources
+                outputs = []
+                for config in configs:
+                    build_file = 'build-{}.ninja'.format(config)
+                    config_outputs = planned_outputs(
+                        build_file, map_sources(watch_targets, source_paths, build_file),
+                        default_env)
+                    if config_outputs is None:
+                        return None
+                    outputs += config_outputs
+                return outputs
+            parallelism = native.memory.choose_parallelism(planned)
+            if parallelism is not None:
+                targets += ('-j{}'.format(parallelism),)
+            profile.mark('choosing parallelism')
+        if fallback_to_ninja:
+            # Ignore SIGINT because ninja will handle it:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            # This is a fallback for ninja versions that don't support the frontend feature, which
+            # builds multiple configurations one after another:
+            for build_file in (['build-{}.ninja'.format(config) for config in configs]
+                               if configs else [f]):
+                subprocess.check_call(
+                    [
+                        "ninja -f {} {}".format(
+                            build_file, " ".join([shlex.quote(x) for x in targets])
+                        )
+                    ],
+                    shell=True,
+                    env=default_env,
+                )
+        else:
+            fifo = 'ja.fifo'
+            def start_ninja():
+                from ja import ninja as ninja_process
+                ninja = ninja_process.start(f, fifo, targets, default_env)
+                lock.set_ninja_pids([ninja.pid])
+                if native.memory is not None:
+                    native.memory.ninja_pids = [ninja.pid]
+                return ninja
+            record_file = open(record, 'wb', 0) if record else None
+            def open_status_stream(idle):
+                # The report and the input index need the inputs of every edge:
+                selective = native.report is None and native.rebuilds is None
+                return frontend.Frontend(open(fifo, 'rb', 0), idle=idle, record=record_file,
+                                         selective=selective)
+
+            if configs:
+                from ja.configs import MultiConfigBuild
+                from ja.memory import default_parallelism
+                multi_config = MultiConfigBuild(native, configs)
+                missing = multi_config.missing_build_files()
+                if missing:
+                    click.secho("{} not found, --configs needs a build directory of CMake's Ninja "
+                                "Multi-Config generator.".format(', '.join(missing)), fg='red')
+                    exit(1)
+                # Without the -j in targets, MultiConfigBuild shares the jobs between the ninjas:
+                config_targets = watch_targets + (('-v',) if v else ())
+                ninja_pids = multi_config.start(config_targets,
+                                                parallelism or default_parallelism(), default_env,
+                                                ninja_caps.version_at_least(1, 13), source_paths)
+                lock.set_ninja_pids(ninja_pids)
+                profile.mark('spawning ninja')
+            elif watch:
+                from ja.watch import Watch
+                try:
+                    watcher = Watch(native, f, watch_targets, start_ninja, open_status_stream,
+                                    lock)
+                except OSError as err:
+                    click.secho('--watch: {}'.format(err), fg='red')
+                    exit(1)
+            else:
+                ninja = start_ninja()
+                profile.mark('spawning ninja')
+            if not no_compiler_cache:
+                from ja import compiler_cache
+                tool = compiler_cache.used_tool()
+                if tool is not None:
+                    native.compiler_cache = compiler_cache.CompilerCacheStats(tool, history)
+                    profile.mark('reading compiler cache statistics')
+
+            # Load protobuf while ninja is still starting up, before blocking on the FIFO:
+            from ja import frontend
+            frontend.status_class()
+            profile.mark('loading Status message class')
+
+            try:
+                if configs:
+                    multi_config.open_streams(native.report is None and native.rebuilds is None)
+                    profile.mark('waiting for ninja to open the status streams')
+                    failed = multi_config.run()
+                    lock.set_ninja_pids([]) # every ninja has exited
+                    if failed:
+                        native.printer.print_line('\x1b[1;31mbuild failed in {}.\x1b[0m'.format(
+                            ', '.join(failed)), native.printer.LINE_FULL)
+                        exit(1)
+                else:
+                    if watch:
+                        watcher.run() # until Ctrl+C
+                    status_stream = open_status_stream(native.wait_for_input)
+                    profile.mark('waiting for ninja to open the status stream')
+                    for msg in status_stream:
+                        if native.handle(msg):
+                            # ja exits now, keep what we've seen of the build so far:
+                            native.build_stopped()
+                            # ninja keeps running, let the next ja show its progress:
+                            from ja.attach import detach
+                            detach(status_stream, native, ninja.pid, lock)
+                            exit(1)
+                    # The stream ends when ninja exits, its PID might be reused afterwards:
+                    ninja.wait()
+                    lock.set_ninja_pids([])
+                if native.rebuilds is not None:
+                    for line in native.rebuilds.lines():
+                        native.printer.print_line(line, native.printer.LINE_FULL)
+            except KeyboardInterrupt:
+                native.build_stopped()
+                native.printer.print_on_new_line('\x1b[1;31mbuild stopped: interrupted by user.\x1b[0m\n')
+                if configs:
+                    multi_config.cancel()
+                try:
+                    os.remove(fifo)
+                except FileNotFoundError:
+                    pass # subprocess already deleted the file
+                exit(130)
+
+    except subprocess.CalledProcessError as err:
+        exit(err.returncode)
@@ -0,0 +1,134 @@
+"""Thin client which lets a running ja server (see ja/server.py) do the build.
+
+It's imported before anything else of ja and therefore only uses modules which are quick to
+import: _socket and _signal instead of socket and signal, which import enum, selectors etc. The
+terminal file descriptors are passed to the server, so that the build writes to the terminal
+directly, while signals are forwarded to the process running it.
+"""
+
+import _signal
+import _socket
+import os
+import stat
+import sys
+
+PROTOCOL = b'ja1'
+
+# stdin, stdout and stderr as an array of C ints, for SCM_RIGHTS.
+STDIO_FDS = b''.join(fd.to_bytes(4, sys.byteorder) for fd in (0, 1, 2))
+
+# Signals which are forwarded to the process running the build.
+FORWARDED_SIGNALS = (_signal.SIGINT, _signal.SIGTERM, _signal.SIGHUP, _signal.SIGWINCH)
+
+def socket_dir():
+    """Directory of the socket, which only the user may access."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return runtime_dir
+    # Anyone could create the socket directly in /tmp, so it's put into a directory of its own:
+    return os.path.join(os.environ.get('TMPDIR') or '/tmp', 'ja-{}'.format(os.getuid()))
+
+def socket_path():
+    return os.path.join(socket_dir(), 'ja-{}.sock'.format(os.getuid()))
+
+def is_private_dir(path):
+    """Whether path is a directory of the user which nobody else may access."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and st.st_mode & 0o077 == 0
+
+def is_trusted_socket(path):
+    """Whether path is a socket of the user in a private directory, so that it can't have been
+    created by someone else."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid() and \
+           is_private_dir(os.path.dirname(path))
+
+def peer_uid(sock):
+    """User ID of the process listening on the other end of sock, None if it's unknown."""
+    if not hasattr(_socket, 'SO_PEERCRED'):
+        return None
+    # struct ucred: pid, uid, gid
+    creds = sock.getsockopt(_socket.SOL_SOCKET, _socket.SO_PEERCRED, 12)
+    return int.from_bytes(creds[4:8], sys.byteorder)
+
+def code_version():
+    """Modification times of ja's modules, so that a server doesn't run outdated code."""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return ','.join(sorted('{}:{}'.format(entry.name, entry.stat().st_mtime_ns)
+                           for entry in os.scandir(package_dir)
+                           if entry.name.endswith(('.py', '.pb')))).encode()
+
+def encode_request(argv):
+    fields = [PROTOCOL, code_version(), os.fsencode(os.getcwd()), str(len(argv)).encode()]
+    fields += [os.fsencode(arg) for arg in argv]
+    fields += [os.fsencode(key) + b'=' + os.fsencode(value) for key, value in os.environ.items()]
+    return b'\0'.join(fields)
+
+def read_line(sock, buffer):
+    """Returns the words of the next line the server sent, buffer keeps what has been received
+    after it.
+    """
+    data = b''.join(buffer)
+    while b'\n' not in data:
+        chunk = sock.recv(256)
+        if not chunk:
+            return []
+        data += chunk
+    line, _, buffer[:] = data.partition(b'\n')
+    return line.split()
+
+def run_in_server(argv=None):
+    """Exits with the exit code of the build if a ja server ran it, returns if there's none.
+
+    Set JA_NO_SERVER=1 to always build in-process.
+    """
+    if os.environ.get('JA_NO_SERVER', '0') != '0':
+        return
+    path = socket_path()
+    if not is_trusted_socket(path):
+        return # also when there's no server
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    reply = []
+    try:
+        sock.connect(path)
+        # The environment and the terminal are only handed to a server run by this user:
+        uid = peer_uid(sock)
+        if uid is not None and uid != os.getuid():
+            sock.close()
+            return
+        request = encode_request(sys.argv[1:] if argv is None else argv)
+        sock.sendmsg([request[:1]],
+                     [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, STDIO_FDS)])
+        sock.sendall(request[1:])
+        sock.shutdown(_socket.SHUT_WR)
+        line = read_line(sock, reply)
+    except OSError:
+        sock.close()
+        return # no server running, or one from another ja version which is shutting down
+    if len(line) != 2 or line[0] != b'pid':
+        sock.close()
+        return
+
+    pid = int(line[1])
+    def forward(signum, frame):
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+    for signum in FORWARDED_SIGNALS:
+        _signal.signal(signum, forward)
+
+    try:
+        line = read_line(sock, reply)
+    except OSError:
+        line = []
+    if len(line) == 2 and line[0] == b'exit':
+        sys.exit(int(line[1]))
+    sys.stderr.write('\x1b[1;31mja server stopped unexpectedly.\x1b[0m\n')
+    sys.exit(1)
@@ -2,21 +2,109 @@
 
 import subprocess
 import io
+import os
+import re
+import shutil
 import sys
-from ja.log import log
+import time
+import zlib
+from ja.log import format_millis, log
+from ja.store import write_atomically
 
-def run_cmake(argv, verbose):
+# Checks which took at least this many seconds show their duration.
+SHOW_DURATION = 0.1
+
+# Slowest checks listed after configuring.
+SLOWEST_CHECKS = 5
+
+# Cache entries of a configure which are seeded into the next configure of the same project with
+# the same toolchain: the results of checks like check_include_file and try_compile. Entries which
+# belong to the build directory aren't seeded.
+cache_entry_re = re.compile(r'^([A-Za-z_][^:]*):INTERNAL=(.*)$')
+UNSEEDED_SUFFIXES = ('_BINARY_DIR', '_SOURCE_DIR', '_IS_TOP_LEVEL')
+
+def toolchain_key(argv):
+	"""Identifies the project, the CMake arguments except the build directory and the tools and
+	flags which influence the results of checks."""
+	parts = [os.path.realpath('.')]
+	parts += [arg for arg in argv if not arg.startswith('-B')]
+	for tool in ('cmake', os.environ.get('CC') or 'cc', os.environ.get('CXX') or 'c++'):
+		path = shutil.which(tool)
+		if path is None:
+			parts.append(tool)
+			continue
+		path = os.path.realpath(path)
+		stat = os.stat(path)
+		parts += [path, str(stat.st_size), str(stat.st_mtime_ns)]
+	for name in ('CFLAGS', 'CXXFLAGS', 'LDFLAGS', 'CMAKE_TOOLCHAIN_FILE'):
+		parts.append('{}={}'.format(name, os.environ.get(name, '')))
+	return '\0'.join(parts)
+
+def seed_path(argv):
+	from ja.capabilities import cache_dir
+	return os.path.join(cache_dir(), 'cmake-seed-{:08x}.cmake'.format(
+		zlib.crc32(toolchain_key(argv).encode('utf-8', 'surrogateescape'))))
+
+def cmake_quote(value):
+	return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$'))
+
+def save_seed(argv, build_dir):
+	"""Saves the check results of the configured build_dir as an initial cache script for
+	`cmake -C`. Returns the number of entries."""
+	build_dir = os.path.realpath(build_dir)
+	entries = []
+	try:
+		with open(os.path.join(build_dir, 'CMakeCache.txt'), encoding='utf-8',
+		          errors='surrogateescape') as f:
+			for line in f:
+				match = cache_entry_re.match(line.rstrip('\n'))
+				if match is None:
+					continue
+				name, value = match.groups()
+				if name.startswith('CMAKE_') or name.endswith(UNSEEDED_SUFFIXES) or \
+				   build_dir in value:
+					continue
+				entries.append('set({} {} CACHE INTERNAL "")\n'.format(name, cmake_quote(value)))
+		path = seed_path(argv)
+	except OSError:
+		return 0
+
+	def write(f):
+		f.write('# Check results of a previous configure, written by ja\n')
+		f.writelines(entries)
+	if not write_atomically(path, write, 'w', encoding='utf-8', errors='surrogateescape'):
+		return 0
+	return len(entries)
+
+def run_cmake(argv, verbose, build_dir=None, profiling_output=None):
+	"""Configures with CMake. A new build_dir starts with the check results of the last configure
+	of this project with the same toolchain. profiling_output is a file for CMake's profiling data
+	in the Google Trace format."""
 	cmd = ['cmake'] + argv
+	seed = None
+	if build_dir is not None and not os.path.exists(os.path.join(build_dir, 'CMakeCache.txt')):
+		try:
+			seed = seed_path(argv)
+		except OSError:
+			pass # no cache directory
+		if seed is not None and os.path.exists(seed):
+			cmd += ['-C', seed]
+	if profiling_output:
+		cmd += ['--profiling-format=google-trace', '--profiling-output=' + profiling_output]
 	log('$ ' + ' '.join(['"{}"'.format(x) if ' ' in x else x for x in cmd]), True)
+	start = time.monotonic()
+	checks = [] # (seconds, check)
 	if verbose:
 		proc = subprocess.Popen(cmd)
 	else:
 		proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
 		previous_line = ''
+		previous_time = start
 		color = ''
 
 		for line in io.TextIOWrapper(proc.stdout, encoding='utf-8'):
+			now = time.monotonic()
 			if len(previous_line) > 0 and line.startswith(previous_line):
 				status = line[len(previous_line):].strip()
 				if status.startswith('- '):
@@ -28,7 +116,10 @@ def run_cmake(argv, verbose):
 					result_color = '\x1b[1;32m'
 				if status == 'Failed' or status == 'failed' or status == 'not found' or status == 'no' or status == 'NOTFOUND':
 					result_color = '\x1b[1;31m'
-				print(': {}{}\x1b[0m\n'.format(result_color, status), end='', flush=True)
+				duration = now - previous_time
+				checks.append((duration, previous_line[3:] if previous_line.startswith('-- ') else previous_line))
+				duration_text = ' \x1b[2m{}\x1b[0m'.format(format_millis(duration * 1000)) if duration >= SHOW_DURATION else ''
+				print(': {}{}\x1b[0m{}\n'.format(result_color, status, duration_text), end='', flush=True)
 				previous_line = ''
 			else:
 				line = line.rstrip()
@@ -39,6 +130,7 @@ def run_cmake(argv, verbose):
 				elif not line.startswith('  '): # for indented lines, keep the previous color
 					color = ''
 				previous_line = line
+				previous_time = now
 				if line.startswith('-- '):
 					line = '▸' + line[2:]
 					# color = '\x1b[1m'
@@ -63,3 +155,15 @@ def run_cmake(argv, verbose):
 	proc.wait() # sets returncode, shouldn't block
 	if proc.returncode != 0:
 		exit(proc.returncode)
+
+	elapsed = time.monotonic() - start
+	checks.sort(reverse=True)
+	slowest = [check for check in checks[:SLOWEST_CHECKS] if check[0] >= SHOW_DURATION]
+	print('\x1b[1;34mconfigured in {}{}\x1b[0m'.format(format_millis(elapsed * 1000),
+	      ', {} check{} took {}, the slowest:'.format(
+	          len(checks), 's' if len(checks) != 1 else '',
+	          format_millis(sum(check[0] for check in checks) * 1000)) if slowest else ''))
+	for duration, check in slowest:
+		print('  {:>6}  {}'.format(format_millis(duration * 1000), check))
+	if seed is not None and build_dir is not None:
+		save_seed(argv, build_dir)
@@ -0,0 +1,117 @@
+"""ccache or sccache as compiler launcher and how many compiles they saved.
+
+New CMake build directories are configured with the first of TOOLS which is installed as
+CMAKE_<LANG>_COMPILER_LAUNCHER. Meson uses ccache and sccache on its own. The statistics of the
+tool are read before and after each build, so that the summary can report the hits and misses
+of this build.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+
+from ja.log import format_millis
+
+TOOLS = ('ccache', 'sccache')
+
+LANGUAGES = ('C', 'CXX')
+
+# Keys of `ccache --print-stats` (ccache >= 4) for hits and misses:
+CCACHE_HITS = ('direct_cache_hit', 'preprocessed_cache_hit')
+CCACHE_MISSES = ('cache_miss',)
+
+# Lines of `ccache -s` of older versions:
+ccache_hit_re = re.compile(r'^cache hit \((?:direct|preprocessed)\)\s+(\d+)', re.MULTILINE)
+ccache_miss_re = re.compile(r'^cache miss\s+(\d+)', re.MULTILINE)
+
+def find_tool():
+    """Returns the name of an installed compiler cache or None."""
+    for tool in TOOLS:
+        if shutil.which(tool) is not None:
+            return tool
+    return None
+
+def cmake_args(tool):
+    return ['-DCMAKE_{}_COMPILER_LAUNCHER={}'.format(language, tool) for language in LANGUAGES]
+
+def used_tool():
+    """Returns which of TOOLS the build directory compiles with, None if none."""
+    try:
+        with open('CMakeCache.txt', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if '_COMPILER_LAUNCHER:' in line:
+                    launcher = os.path.basename(line.split('=', 1)[1].strip())
+                    if launcher in TOOLS:
+                        return launcher
+        return None
+    except OSError:
+        pass
+    # Meson picks the tool up on its own, the compilers it found start with it:
+    try:
+        with open(os.path.join('meson-info', 'intro-compilers.json'), encoding='utf-8') as f:
+            machines = json.load(f)
+        for compilers in machines.values(): # "host" and "build"
+            for compiler in compilers.values():
+                launcher = os.path.basename(compiler['exelist'][0])
+                if launcher in TOOLS:
+                    return launcher
+    except (OSError, ValueError, KeyError, TypeError, IndexError, AttributeError):
+        pass
+    return None
+
+def read_stats(tool):
+    """Returns (hits, misses) so far, None if the statistics couldn't be read."""
+    try:
+        if tool == 'sccache':
+            proc = subprocess.run(['sccache', '--show-stats', '--stats-format=json'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            stats = json.loads(proc.stdout.decode())['stats']
+            return (sum(stats['cache_hits']['counts'].values()),
+                    sum(stats['cache_misses']['counts'].values()))
+        proc = subprocess.run(['ccache', '--print-stats'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL)
+        if proc.returncode == 0:
+            stats = {}
+            for line in proc.stdout.decode().splitlines():
+                key, _, value = line.partition('\t')
+                stats[key] = value
+            return (sum(int(stats.get(key, 0)) for key in CCACHE_HITS),
+                    sum(int(stats.get(key, 0)) for key in CCACHE_MISSES))
+        text = subprocess.run(['ccache', '-s'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL).stdout.decode()
+        misses = ccache_miss_re.search(text)
+        if misses is None:
+            return None
+        return sum(int(hits) for hits in ccache_hit_re.findall(text)), int(misses.group(1))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+class CompilerCacheStats(object):
+    def __init__(self, tool, history=None):
+        self.tool = tool
+        # DurationHistory, to estimate how long the hits would have taken:
+        self.history = history
+        self.before = read_stats(tool)
+        self.average_duration = None
+        if history is not None and history.durations:
+            self.average_duration = sum(history.durations.values()) / len(history.durations)
+
+    def lines(self):
+        if self.before is None:
+            return []
+        after = read_stats(self.tool)
+        if after is None:
+            return []
+        hits = max(after[0] - self.before[0], 0) # the statistics might have been zeroed
+        misses = max(after[1] - self.before[1], 0)
+        self.before = after # for the next build in watch mode
+        if hits <= 0 and misses <= 0:
+            return []
+        text = '{}: {} hit{}, {} miss{} ({:.0f}% hits)'.format(
+            self.tool, hits, 's' if hits != 1 else '', misses, 'es' if misses != 1 else '',
+            100 * hits / (hits + misses))
+        if hits > 0 and self.average_duration is not None:
+            text += ', saved about {}'.format(format_millis(hits * self.average_duration))
+        return [text]
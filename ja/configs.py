@@ -0,0 +1,196 @@
+"""Building several configurations of CMake's Ninja Multi-Config generator at once (`ja --configs
+Debug,Release`).
+
+Every configuration has its own build-<config>.ninja which ninja builds independently, so ja runs
+one ninja per configuration at the same time, each writing to its own FIFO which has its own
+Frontend. Their messages are merged into one NinjaNativeFrontend: edge ids are made unique, the
+totals are summed up and the descriptions of jobs and messages start with their configuration.
+
+The configurations share the jobs through a GNU make jobserver when ninja supports it (1.13 and
+later): every ninja takes a token from the same FIFO for each job beyond its first, so that a
+configuration which has finished or which can't run many jobs in parallel at the moment leaves
+its share to the others. Older ninjas are started with an equal part of the jobs each.
+"""
+
+import os
+import select
+
+from ja import ninja
+
+JOBSERVER_FIFO = 'ja.jobserver'
+
+def parse_configs(text):
+    """'Debug,Release' -> ['Debug', 'Release']"""
+    configs = []
+    for config in text.split(','):
+        config = config.strip()
+        if config and config not in configs:
+            configs.append(config)
+    return configs
+
+def split_jobs(jobs, count):
+    """Splits jobs into count parts which differ by at most one, each at least one job."""
+    return [max(jobs // count + (1 if i < jobs % count else 0), 1) for i in range(count)]
+
+class JobServer(object):
+    """FIFO with one token per job which a ninja may run in addition to its first one."""
+
+    def __init__(self, jobs, clients, path=JOBSERVER_FIFO):
+        self.jobs = jobs
+        self.path = os.path.abspath(path)
+        try:
+            os.remove(self.path) # left behind by a ja which has been killed
+        except FileNotFoundError:
+            pass
+        os.mkfifo(self.path)
+        # Opened for reading and writing, so that the tokens stay in the FIFO while no ninja has it
+        # open:
+        self.fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK | os.O_CLOEXEC)
+        os.write(self.fd, b'+' * max(jobs - clients, 0))
+
+    def env(self, env):
+        env = dict(env)
+        env['MAKEFLAGS'] = '-j{} --jobserver-auth=fifo:{}'.format(self.jobs, self.path)
+        return env
+
+    def close(self):
+        os.close(self.fd)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class ConfigBuild(object):
+    def __init__(self, index, config):
+        self.index = index
+        self.config = config
+        self.build_file = 'build-{}.ninja'.format(config)
+        self.fifo = 'ja.{}.fifo'.format(config)
+        self.ninja = None # Popen
+        self.stream = None # Frontend
+        self.total_edges = 0
+        self.finished = False # received build_finished
+        self.failed = False
+
+class MultiConfigBuild(object):
+    def __init__(self, native, configs):
+        self.native = native
+        self.builds = [ConfigBuild(index, config) for index, config in enumerate(configs)]
+        self.jobserver = None
+        self.jobs = 1
+        self.build_started = False
+
+    def missing_build_files(self):
+        return [build.build_file for build in self.builds if not os.path.exists(build.build_file)]
+
+    def start(self, targets, jobs, env, use_jobserver, source_paths=None):
+        """Starts a ninja for every configuration, each running at most jobs together.
+
+        Targets which are source files (see source_paths of map_sources) are replaced by the
+        objects of each configuration.
+        """
+        self.jobs = jobs
+        if use_jobserver:
+            self.jobserver = JobServer(jobs, len(self.builds))
+            env = self.jobserver.env(env)
+            job_args = [[]] * len(self.builds) # -j would make ninja ignore the jobserver
+        else:
+            job_args = [['-j{}'.format(part)] for part in split_jobs(jobs, len(self.builds))]
+        for build, args in zip(self.builds, job_args):
+            build_targets = targets
+            if source_paths:
+                from ja.sources import map_sources
+                build_targets = map_sources(targets, source_paths, build.build_file)
+            build.ninja = ninja.start(build.build_file, build.fifo, list(build_targets) + args,
+                                      env)
+        if self.native.memory is not None:
+            self.native.memory.ninja_pids = [build.ninja.pid for build in self.builds]
+        return [build.ninja.pid for build in self.builds]
+
+    def open_streams(self, selective):
+        from ja import frontend
+        for build in self.builds:
+            build.stream = frontend.Frontend(open(build.fifo, 'rb', 0), selective=selective)
+
+    def run(self):
+        """Shows the builds until every ninja has finished. Returns the configurations which
+        failed."""
+        native = self.native
+        building = list(self.builds)
+        while building:
+            readers = [build.stream.reader for build in building]
+            native.wait_for_input(readers)
+            readable = select.select(readers, [], [])[0]
+            for build in list(building):
+                if build.stream.reader not in readable:
+                    continue
+                more = build.stream.read_chunk()
+                pending = build.stream.pending
+                while pending:
+                    msg = self.translate(build, pending.popleft())
+                    if msg is not None:
+                        native.handle(msg)
+                if not more:
+                    build.stream.reader.close()
+                    build.ninja.wait()
+                    if not build.finished or build.ninja.returncode != 0:
+                        build.failed = True
+                    building.remove(build)
+        self.close()
+        failed = [build.config for build in self.builds if build.failed]
+        if failed:
+            native.build_stopped()
+        return failed
+
+    def translate(self, build, msg):
+        """Turns a message of one configuration into one for the merged build, None if it has to
+        be dropped."""
+        if msg.HasField('total_edges'):
+            build.total_edges = msg.total_edges.total_edges
+            msg.total_edges.total_edges = sum(other.total_edges for other in self.builds)
+        if msg.HasField('build_started'):
+            if self.build_started:
+                return None
+            self.build_started = True
+            msg.build_started.parallelism = self.jobs
+        if msg.HasField('build_finished'):
+            build.finished = True
+            # The summary is shown once all configurations have finished successfully:
+            if any(not other.finished or other.failed for other in self.builds):
+                return None
+        if msg.HasField('edge_started'):
+            edge_started = msg.edge_started
+            edge_started.id = edge_started.id * len(self.builds) + build.index
+            edge_started.desc = '{}: {}'.format(build.config,
+                                                edge_started.desc or edge_started.command)
+        if msg.HasField('edge_finished'):
+            edge_finished = msg.edge_finished
+            edge = self.native.running.get(edge_finished.id * len(self.builds) + build.index)
+            edge_finished.id = edge_finished.id * len(self.builds) + build.index
+            if edge_finished.status != 0:
+                build.failed = True
+                if edge is not None:
+                    # The output which follows doesn't say which configuration it belongs to:
+                    self.native.printer.print_line('\x1b[1;31m{} failed:\x1b[0m'.format(
+                        edge.desc), self.native.printer.LINE_FULL)
+        if msg.HasField('message'):
+            if msg.message.level == 2:
+                build.failed = True
+            msg.message.message = '{}: {}'.format(build.config, msg.message.message)
+        return msg
+
+    def cancel(self):
+        for build in self.builds:
+            if build.ninja is not None:
+                ninja.cancel(build.ninja.pid)
+        self.close()
+
+    def close(self):
+        for build in self.builds:
+            try:
+                os.remove(build.fifo)
+            except FileNotFoundError:
+                pass # ninja's frontend already deleted it
+        if self.jobserver is not None:
+            self.jobserver.close()
+            self.jobserver = None
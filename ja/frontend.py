@@ -6,9 +6,185 @@ This module implements a Ninja frontend interface that delegates handling each
 message to a handler object
 """
 
+import collections
 import os
-import google.protobuf.descriptor_pb2
-import google.protobuf.message_factory
+
+# Number of bytes requested from the reader at once. Every complete message inside a chunk is
+# decoded before the next read, so a busy ninja costs one syscall per chunk instead of two per
+# message.
+CHUNK_SIZE = 64 * 1024
+
+# ninja.Status message class, built on first use and shared by every Frontend in this process.
+_status_class = None
+
+def read_varint(data, pos):
+    """Returns the varint at data[pos:] and the position after it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if (byte & 0x80) == 0:
+            return value, pos
+        shift += 7
+
+def status_class():
+    """Returns the ninja.Status message class described by frontend.pb.
+
+    frontend.pb is a FileDescriptorSet with exactly one `file` entry (field 1, length-delimited).
+    Slicing the FileDescriptorProto out by hand lets us add it to a descriptor pool directly,
+    without importing and parsing through descriptor_pb2, which dominates protobuf's import time.
+    """
+    global _status_class
+    if _status_class is not None:
+        return _status_class
+
+    from google.protobuf import descriptor_pool, message_factory
+
+    descriptor = 'frontend.pb'
+    with open(os.path.join(os.path.dirname(__file__), descriptor), 'rb') as f:
+        data = f.read()
+
+    if data[:1] != b'\x0a':
+        raise RuntimeError('expected exactly one file descriptor in ' + descriptor)
+    size, pos = read_varint(data, 1)
+    if pos + size != len(data):
+        raise RuntimeError('expected exactly one file descriptor in ' + descriptor)
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.AddSerializedFile(data[pos:])
+    message_descriptor = pool.FindMessageTypeByName('ninja.Status')
+    try:
+        _status_class = message_factory.GetMessageClass(message_descriptor)
+    except AttributeError: # protobuf < 4.21
+        _status_class = message_factory.MessageFactory(pool).GetPrototype(message_descriptor)
+    return _status_class
+
+def selective_decoding_helps():
+    """Whether decode_selectively is faster than the protobuf runtime. That's only the case for
+    its pure Python implementation, upb and the C++ implementation decode everything in C faster
+    than Python can skip the inputs of an edge.
+    """
+    try:
+        from google.protobuf.internal import api_implementation
+        return api_implementation.Type() == 'python'
+    except ImportError:
+        return False
+
+def decode_string(data, start, end):
+    return data[start:end].decode('utf-8', 'replace')
+
+class LazyEdgeStarted(object):
+    """EdgeStarted without its inputs, which are decoded with the whole message on first access."""
+
+    __slots__ = ('id', 'start_time', 'outputs', 'desc', 'command', 'console', 'data', 'full')
+
+    def __init__(self, data):
+        self.id = 0
+        self.start_time = 0
+        self.outputs = []
+        self.desc = ''
+        self.command = ''
+        self.console = False
+        self.data = data # serialized Status message
+        self.full = None
+
+    @property
+    def inputs(self):
+        if self.full is None:
+            self.full = status_class().FromString(self.data).edge_started
+        return self.full.inputs
+
+class LazyEdgeFinished(object):
+    __slots__ = ('id', 'end_time', 'status', 'output')
+
+    def __init__(self):
+        self.id = 0
+        self.end_time = 0
+        self.status = 0
+        self.output = ''
+
+class LazyStatus(object):
+    """Status message with only an edge_started or an edge_finished field."""
+
+    __slots__ = ('edge_started', 'edge_finished')
+
+    def __init__(self, edge_started=None, edge_finished=None):
+        self.edge_started = edge_started
+        self.edge_finished = edge_finished
+
+    def HasField(self, name):
+        return name in ('edge_started', 'edge_finished') and getattr(self, name) is not None
+
+def decode_selectively(data, pos, end):
+    """Decodes the Status message data[pos:end] without the protobuf runtime if it only has an
+    edge_started or an edge_finished field, which are most of the messages. Returns None for other
+    messages and for anything unexpected, which have to be decoded fully.
+    """
+    if end - pos < 2:
+        return None
+    status_start = pos
+    tag = data[pos]
+    if tag != 0x22 and tag != 0x2a: # field 4 or 5, length-delimited
+        return None
+    size, pos = read_varint(data, pos + 1)
+    if pos + size != end:
+        return None # more fields follow
+
+    if tag == 0x22:
+        msg = LazyEdgeStarted(bytes(data[status_start:end]))
+    else:
+        msg = LazyEdgeFinished()
+    while pos < end:
+        key = data[pos]
+        pos += 1
+        if key & 0x80:
+            return None # field numbers above 15 aren't used
+        value = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        wire_type = key & 7
+        if wire_type == 2:
+            start = pos
+            pos += value
+            if tag == 0x22:
+                if key == 0x1a: # inputs
+                    continue
+                elif key == 0x22:
+                    msg.outputs.append(decode_string(data, start, pos))
+                elif key == 0x2a:
+                    msg.desc = decode_string(data, start, pos)
+                elif key == 0x32:
+                    msg.command = decode_string(data, start, pos)
+            elif key == 0x22:
+                msg.output = decode_string(data, start, pos)
+        elif wire_type != 0:
+            return None
+        elif tag == 0x22:
+            if key == 0x08:
+                msg.id = value
+            elif key == 0x10:
+                msg.start_time = value
+            elif key == 0x38:
+                msg.console = value != 0
+        elif key == 0x08:
+            msg.id = value
+        elif key == 0x10:
+            msg.end_time = value
+        elif key == 0x18:
+            msg.status = (value >> 1) ^ -(value & 1) # sint32
+    if pos != end:
+        return None
+    if tag == 0x22:
+        return LazyStatus(edge_started=msg)
+    return LazyStatus(edge_finished=msg)
 
 def default_reader():
     fd = 3
@@ -19,21 +195,28 @@ class Frontend(object):
     through a ninja frontend interface.
     """
 
-    def __init__(self, reader=None):
+    def __init__(self, reader=None, chunk_size=CHUNK_SIZE, idle=None, record=None,
+                 selective=True):
         self.reader = reader if reader else default_reader()
+        # Binary file the raw stream is copied to, so that it can be replayed later:
+        self.record = record
+        # Called with the reader whenever all received messages have been consumed and the next
+        # read might block:
+        self.idle = idle
+        # Buffered readers would block in read() until the whole chunk is available:
+        self.read = getattr(self.reader, 'read1', self.reader.read)
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.pending = collections.deque()
         self.status_class = self.get_status_proto()
+        # Pass selective=False if the inputs of most edges are needed, e.g. for the report:
+        self.selective = selective and selective_decoding_helps()
 
-    def get_status_proto(self):
-        fd_set = google.protobuf.descriptor_pb2.FileDescriptorSet()
-        descriptor = 'frontend.pb'
-        with open(os.path.join(os.path.dirname(__file__), 'frontend.pb'), 'rb') as f:
-            fd_set.ParseFromString(f.read())
+        from google.protobuf.message import DecodeError
+        self.decode_error = DecodeError
 
-        if len(fd_set.file) != 1:
-            raise RuntimeError('expected exactly one file descriptor in ' + descriptor)
-
-        messages = google.protobuf.message_factory.GetMessages(fd_set.file)
-        return messages['ninja.Status']
+    def get_status_proto(self):
+        return status_class()
 
     def __iter__(self):
         return self
@@ -42,33 +225,62 @@ class Frontend(object):
         return self.next()
 
     def next(self):
-        size = 0
-        shift = 0
-        while True:
-            byte = bytearray(bytes(self.reader.read(1)))
-            if not byte:
+        while not self.pending:
+            if self.idle is not None:
+                self.idle(self.reader)
+            if not self.read_chunk():
                 raise StopIteration()
+        return self.pending.popleft()
 
-            byte = byte[0]
-            size += (byte & 0x7f) << (shift * 7)
-            if (byte & 0x80) == 0:
-                break
-            shift += 1
-            if shift > 4:
-                raise "Expected varint32 length-delimeted message"
-
-        message = bytes(self.reader.read(size))
-        while len(message) < size:
-            new_bytes = bytes(self.reader.read(size - len(message)))
-            if not new_bytes:
-                break
-            message += new_bytes
+    def read_chunk(self):
+        """Reads the next chunk and decodes its messages into self.pending. Returns False at the
+        end of the stream."""
+        chunk = self.read(self.chunk_size)
+        if not chunk:
+            if self.buffer:
+                raise Exception('Unexpected EOF with {} bytes of an incomplete message'.format(
+                    len(self.buffer)))
+            return False
+        if self.record is not None:
+            self.record.write(chunk)
+        self.buffer += chunk
+        self.decode_buffer()
+        return True
 
-        if len(message) != size:
-            raise Exception("Unexpected EOF reading {} bytes".format(size))
+    def decode_buffer(self):
+        """Decodes every complete message in self.buffer and keeps the incomplete rest."""
+        buf = self.buffer
+        end = len(buf)
+        pos = 0
+        while pos < end:
+            size = 0
+            shift = 0
+            i = pos
+            while i < end:
+                byte = buf[i]
+                i += 1
+                size |= (byte & 0x7f) << (shift * 7)
+                if (byte & 0x80) == 0:
+                    break
+                shift += 1
+                if shift > 4:
+                    raise Exception("Expected varint32 length-delimeted message")
+            else:
+                break # length prefix is incomplete
+            if i + size > end:
+                break # payload is incomplete
 
-        try:
-            return self.status_class.FromString(message)
-        except google.protobuf.message.DecodeError as err:
-            print(err)
-            return self.next()
+            pos = i + size
+            if self.selective:
+                try:
+                    msg = decode_selectively(buf, i, pos)
+                except IndexError:
+                    msg = None # truncated, let protobuf report the error
+                if msg is not None:
+                    self.pending.append(msg)
+                    continue
+            try:
+                self.pending.append(self.status_class.FromString(bytes(buf[i:pos])))
+            except self.decode_error as err:
+                print(err)
+        del buf[:pos]
@@ -0,0 +1,148 @@
+"""Durations of the edges of previous builds.
+
+The history is stored in the build directory as arrays of 64 bit output hashes, durations, how
+much the durations vary and the number of the build which last ran the edge, so that it can be
+loaded without parsing. When there's no history yet, it's imported from ninja's .ninja_log.
+"""
+
+import array
+import hashlib
+import struct
+
+from ja.store import BYTE_ORDER, write_atomically
+
+HISTORY_FILE = '.ja_history'
+
+# Maximum number of edges to remember. Edges which haven't been built for the longest time are
+# dropped first.
+MAX_ENTRIES = 1 << 17
+
+# magic, byte order, generation, number of entries
+HEADER = struct.Struct('<4s1sxxII')
+MAGIC = b'jah3'
+
+# Weight of a new duration in the moving average of the deviations.
+DEVIATION_WEIGHT = 0.25
+
+# An edge is slow when it takes longer than its usual duration plus this many deviations (for
+# normally distributed durations, 2 mean absolute deviations are about the 95th percentile)...
+SLOW_DEVIATIONS = 2
+# ...but at least this factor longer and this many milliseconds, as a single sample tells
+# nothing about the variation:
+SLOW_FACTOR = 1.5
+SLOW_MIN_MILLIS = 5000
+
+def output_key(output):
+    return int.from_bytes(hashlib.blake2b(output.encode(), digest_size=8).digest(), 'little')
+
+class DurationHistory(object):
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+
+        # Number of builds recorded so far.
+        self.generation = 0
+
+        # Output key -> duration in milliseconds.
+        self.durations = {}
+
+        # Output key -> moving average of how much the duration changed from build to build.
+        self.deviations = {}
+
+        # Output key -> generation which last built it.
+        self.generations = {}
+
+        # Sum and number of durations of the edges which haven't been started in this build yet.
+        self.unstarted_work = 0
+        self.unstarted_count = 0
+        self.started = set()
+
+    def load(self):
+        """Loads the history, imports .ninja_log if there's none yet."""
+        try:
+            with open(self.path, 'rb') as f:
+                magic, byte_order, generation, count = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC or byte_order != BYTE_ORDER:
+                    raise ValueError('incompatible ' + self.path)
+                keys = array.array('Q')
+                keys.fromfile(f, count)
+                durations = array.array('I')
+                durations.fromfile(f, count)
+                deviations = array.array('I')
+                deviations.fromfile(f, count)
+                generations = array.array('I')
+                generations.fromfile(f, count)
+        except (OSError, EOFError, ValueError, struct.error):
+            self.import_ninja_log()
+            return
+        self.generation = generation
+        self.durations = dict(zip(keys, durations))
+        self.deviations = {key: deviation for key, deviation in zip(keys, deviations) if deviation}
+        self.generations = dict(zip(keys, generations))
+
+    def import_ninja_log(self, path='.ninja_log'):
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        # Later lines are newer. An edge with several outputs has a line for each of them, in no
+        # particular order, so every output gets the duration, whichever is looked up later:
+        for line in reversed(lines):
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 5 or line.startswith('#'):
+                continue
+            try:
+                start, end = int(fields[0]), int(fields[1])
+            except ValueError:
+                continue
+            key = output_key(fields[3])
+            if key not in self.durations:
+                self.durations[key] = max(end - start, 0)
+                self.generations[key] = 0
+
+    def save(self):
+        keys = list(self.durations)
+        if len(keys) > MAX_ENTRIES:
+            keys.sort(key=self.generations.__getitem__, reverse=True)
+            del keys[MAX_ENTRIES:]
+
+        def write(f):
+            f.write(HEADER.pack(MAGIC, BYTE_ORDER, self.generation, len(keys)))
+            array.array('Q', keys).tofile(f)
+            array.array('I', [min(self.durations[key], 0xffffffff) for key in keys]).tofile(f)
+            array.array('I', [min(self.deviations.get(key, 0), 0xffffffff)
+                              for key in keys]).tofile(f)
+            array.array('I', [self.generations[key] for key in keys]).tofile(f)
+        write_atomically(self.path, write)
+
+    def start_build(self):
+        self.generation += 1
+        self.unstarted_work = sum(self.durations.values())
+        self.unstarted_count = len(self.durations)
+        self.started = set()
+
+    def edge_started(self, key):
+        """Returns the expected duration of the edge or None if it has never been built."""
+        duration = self.durations.get(key)
+        if duration is not None and key not in self.started:
+            self.started.add(key)
+            self.unstarted_work -= duration
+            self.unstarted_count -= 1
+        return duration
+
+    def slow_after(self, key):
+        """Returns after how many milliseconds the edge is unusually slow, None if unknown."""
+        duration = self.durations.get(key)
+        if duration is None:
+            return None
+        return max(duration + SLOW_DEVIATIONS * self.deviations.get(key, 0),
+                   duration * SLOW_FACTOR, duration + SLOW_MIN_MILLIS)
+
+    def record(self, key, duration):
+        previous = self.durations.get(key)
+        if previous is not None:
+            deviation = self.deviations.get(key, 0)
+            deviation += (abs(duration - previous) - deviation) * DEVIATION_WEIGHT
+            self.deviations[key] = int(deviation)
+        self.durations[key] = duration
+        self.generations[key] = self.generation
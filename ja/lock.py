@@ -0,0 +1,151 @@
+"""Lock on the build directory which is granted in the order ja processes asked for it.
+
+Every ja draws a ticket from the counter in .ja_lock and holds an exclusive flock on its ticket
+file .ja_lock.N for as long as it waits for or owns the lock. It owns the lock as soon as the
+flock of the previous ticket is released, which the kernel does immediately when that ja exits
+or crashes. Waiters are therefore woken without polling and a crashed ja never leaves a stale
+lock behind.
+
+ja exits on the first failure while ninja keeps running in the background, so the ticket file
+also records the PIDs of ja and of the ninjas it started (one per configuration with --configs),
+each with its start time. A new owner waits for those ninjas, unless a recorded PID is dead or
+has been reused by another process since. The PIDs are cleared again as soon as ninja has exited.
+"""
+
+import fcntl
+import os
+import select
+import time
+
+LOCK_FILE = '.ja_lock'
+
+def process_running(pid):
+    """Whether pid exists and isn't a zombie which just hasn't been reaped yet."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # exists, but belongs to another user
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            return f.read().rsplit(b')', 1)[1].split()[0] != b'Z'
+    except (OSError, IndexError):
+        return True # no procfs
+
+def process_start_time(pid):
+    """Clock ticks after boot at which pid was started, 0 if unknown. Tells a process apart from a
+    later one which reuses its PID."""
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            # Field 22, counted from the state after the command, which may contain spaces:
+            return int(f.read().rsplit(b')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+def same_process(pid, start_time):
+    """Whether pid is still running and is the process which was started at start_time."""
+    return process_running(pid) and (start_time == 0 or process_start_time(pid) == start_time)
+
+def wait_for_process(pid, start_time=0):
+    # pidfd_open lets us sleep until the process exits, otherwise poll:
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        try:
+            # The PID might have been reused right before pidfd_open:
+            if same_process(pid, start_time):
+                select.select([pidfd], [], [])
+        finally:
+            os.close(pidfd)
+        return
+    while same_process(pid, start_time):
+        time.sleep(0.05)
+
+# Bytes read from a ticket file, enough for the PIDs of many configurations.
+MAX_RECORD_SIZE = 4096
+
+def parse_record(data):
+    """Returns the ja PID (0 if unknown) and a list of (PID, start time) of the ninjas from a
+    ticket file."""
+    try:
+        pids = [int(field) for field in data.split()]
+    except ValueError:
+        return 0, []
+    if not pids:
+        return 0, []
+    # Tickets written by older versions of ja lack the start time:
+    if len(pids) % 2 == 0:
+        pids.append(0)
+    return pids[0], list(zip(pids[1::2], pids[2::2]))
+
+class BuildDirectoryLock(object):
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self.ticket_fd = None
+
+    def ticket_path(self, ticket):
+        return '{}.{}'.format(self.path, ticket)
+
+    def acquire(self, waiting):
+        """Blocks until the build directory is ours, calls waiting(reason) before each wait."""
+        counter_fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(counter_fd, fcntl.LOCK_EX)
+            try:
+                ticket = int(os.read(counter_fd, 32)) + 1
+            except ValueError:
+                ticket = 1
+            while True:
+                try:
+                    self.ticket_fd = os.open(self.ticket_path(ticket),
+                                             os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+                    break
+                except FileExistsError:
+                    ticket += 1 # the counter has been reset, queue up behind the old ticket
+            fcntl.flock(self.ticket_fd, fcntl.LOCK_EX)
+            self.write_record([])
+            os.ftruncate(counter_fd, 0)
+            os.pwrite(counter_fd, str(ticket).encode(), 0)
+        finally:
+            os.close(counter_fd)
+
+        # Tickets of waiters which gave up are left behind by them, so the ninja of an earlier
+        # owner might still be running:
+        previous = ticket - 1
+        while previous > 0:
+            path = self.ticket_path(previous)
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                break
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    ja_pid = parse_record(os.pread(fd, MAX_RECORD_SIZE, 0))[0]
+                    waiting('file lock on build directory (ja, pid {})'.format(ja_pid))
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                for ninja_pid, start_time in parse_record(os.pread(fd, MAX_RECORD_SIZE, 0))[1]:
+                    if ninja_pid > 0 and same_process(ninja_pid, start_time):
+                        waiting('ninja still running in the background (pid {})'.format(
+                            ninja_pid))
+                        wait_for_process(ninja_pid, start_time)
+                os.remove(path)
+            finally:
+                os.close(fd)
+            previous -= 1
+
+    def set_ninja_pids(self, pids):
+        """Records the PIDs of the ninjas, which might outlive this process. An empty list once
+        they have exited."""
+        self.write_record(pids)
+
+    def write_record(self, ninja_pids):
+        fields = [os.getpid()]
+        for pid in ninja_pids:
+            fields += [pid, process_start_time(pid)]
+        os.ftruncate(self.ticket_fd, 0)
+        os.pwrite(self.ticket_fd, '{}\n'.format(' '.join(map(str, fields))).encode(), 0)
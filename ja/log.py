@@ -1,3 +1,48 @@
+import sys
+import time
+
+def format_millis(millis, precise=False):
+    """Duration for humans, e.g. 1.5s, 2m05s or 1h02m.
+
+    precise=True shows every unit down to milliseconds below a minute, e.g. 1.503s or 1h02m05s.
+    """
+    seconds = millis / 1000
+    if seconds >= 3600:
+        if precise:
+            return '{}h{:02}m{:02}s'.format(int(seconds // 3600), int(seconds % 3600 // 60),
+                                            int(seconds % 60))
+        return '{}h{:02}m'.format(int(seconds // 3600), int(seconds % 3600 // 60))
+    if seconds >= 60:
+        return '{}m{:02}s'.format(int(seconds // 60), int(seconds % 60))
+    return ('{:.3f}s' if precise else '{:.1f}s').format(seconds)
+
 def log(msg, verbose):
     if verbose:
         print('\x1b[1;34m' + msg + '\x1b[0m')
+
+class StartupProfile(object):
+    """Records how long each startup phase of ja takes, see --startup-profile."""
+
+    def __init__(self, start):
+        self.enabled = False
+        self.start = start
+        self.last = start
+        self.phases = []
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        total = self.last - self.start
+        sys.stderr.write('\x1b[1;34mstartup profile ({:.1f} ms since ja was imported):\x1b[0m\n'
+                         .format(total * 1e3))
+        for phase, duration in self.phases:
+            sys.stderr.write('{:>9.1f} ms {:5.1f}%  {}\n'.format(
+                duration * 1e3, 100 * duration / total if total > 0 else 0, phase))
+        sys.stderr.flush()
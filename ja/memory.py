@@ -0,0 +1,314 @@
+"""Chooses how many jobs to run in parallel from the memory they needed in previous builds.
+
+While ninja runs, the process tree of every running edge (the `/bin/sh -c COMMAND` ninja spawned
+and its children) is sampled from /proc and the peak RSS of each edge is stored per output in
+the build directory. When -j isn't given, a build runs at most as many jobs as the heaviest of
+its jobs fit into the available memory according to /proc/meminfo, so that a few huge compiles
+running at the same time don't get the machine OOM-killed. Linux only.
+
+Which jobs a build runs is only known after a dry run of ninja, which costs about as much as
+starting the build. It's only done if the heaviest jobs seen so far wouldn't fit.
+"""
+
+import array
+import heapq
+import os
+import struct
+import time
+
+from ja.history import output_key
+from ja.store import BYTE_ORDER, write_atomically
+
+MEMORY_FILE = '.ja_memory'
+
+# Seconds between two samples of the running edges.
+SAMPLE_INTERVAL = 0.5
+
+# Fraction of the available memory which is left for everything else.
+RESERVE = 0.1
+
+# magic, byte order, number of entries
+HEADER = struct.Struct('<4s1sxxxI')
+MAGIC = b'jam1'
+
+# Entries which are kept at most, the lightest are dropped first.
+MAX_ENTRIES = 1 << 17
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def available_memory():
+    """Returns MemAvailable from /proc/meminfo in bytes, None if it's unknown."""
+    try:
+        with open('/proc/meminfo', 'rb') as f:
+            for line in f:
+                if line.startswith(b'MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def default_parallelism():
+    """The number of jobs ninja runs without -j."""
+    processors = os.cpu_count() or 1
+    if processors <= 1:
+        return 2
+    if processors == 2:
+        return 3
+    return processors + 2
+
+def format_bytes(size):
+    if size >= 1 << 30:
+        return '{:.1f} GB'.format(size / (1 << 30))
+    return '{:.0f} MB'.format(size / (1 << 20))
+
+def read_stat(pid):
+    """Returns (parent pid, RSS in bytes) of pid, None if it has exited."""
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            # The name in parentheses might contain spaces:
+            fields = f.read().rsplit(b')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return int(fields[1]), int(fields[21]) * PAGE_SIZE
+
+def read_children(pid):
+    """Returns the PIDs of the children of pid, None if the kernel doesn't list them."""
+    children = []
+    try:
+        tids = os.listdir('/proc/{}/task'.format(pid))
+    except FileNotFoundError:
+        return children # exited
+    for tid in tids:
+        try:
+            with open('/proc/{}/task/{}/children'.format(pid, tid), 'rb') as f:
+                children.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            if os.path.exists('/proc/{}/task/{}'.format(pid, tid)):
+                return None # no CONFIG_PROC_CHILDREN
+        except OSError:
+            pass
+    return children
+
+def read_processes(roots):
+    """Returns {pid: (parent pid, RSS in bytes)} of the descendants of the PIDs in roots."""
+    processes = {}
+    stack = list(roots)
+    while stack:
+        children = read_children(stack.pop())
+        if children is None:
+            return read_all_processes()
+        for pid in children:
+            stat = read_stat(pid)
+            if stat is not None:
+                processes[pid] = stat
+                stack.append(pid)
+    return processes
+
+def read_all_processes():
+    """Returns {pid: (parent pid, RSS in bytes)} of all processes."""
+    processes = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            stat = read_stat(name)
+            if stat is not None:
+                processes[int(name)] = stat
+    return processes
+
+def planned_outputs(build_file, targets, env=None):
+    """Returns the first output of every edge ninja would run to build targets according to a dry
+    run, None if it failed."""
+    import subprocess
+    from ja import frontend
+    try:
+        ninja = subprocess.Popen(['ninja', '-f', build_file, '-n', '--frontend=cat <&3'] +
+                                 list(targets), stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, env=env)
+    except OSError:
+        return None
+    outputs = []
+    try:
+        for msg in frontend.Frontend(ninja.stdout):
+            if msg.HasField('edge_started') and msg.edge_started.outputs:
+                outputs.append(msg.edge_started.outputs[0])
+    except Exception:
+        outputs = None
+    finally:
+        ninja.stdout.close()
+        if ninja.wait() != 0:
+            outputs = None
+    return outputs
+
+def read_command(pid):
+    """Returns COMMAND if pid is a `/bin/sh -c COMMAND` spawned by ninja, otherwise None."""
+    try:
+        with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+            args = f.read().split(b'\0')
+    except OSError:
+        return None
+    if len(args) >= 3 and args[0].endswith(b'sh') and args[1] == b'-c':
+        return args[2].decode('utf-8', 'replace')
+    return None
+
+def jobs_fitting(peaks, budget):
+    """Returns how many of peaks (in KiB, heaviest first) fit into budget bytes together."""
+    used = 0
+    jobs = 0
+    for peak in peaks:
+        used += peak * 1024
+        if used > budget:
+            break
+        jobs += 1
+    return jobs
+
+class MemoryHistory(object):
+    """Peak RSS in KiB per output of previous builds."""
+
+    def __init__(self, path=MEMORY_FILE):
+        self.path = path
+        self.peaks = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                magic, byte_order, count = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC or byte_order != BYTE_ORDER:
+                    return
+                keys = array.array('Q')
+                keys.fromfile(f, count)
+                peaks = array.array('I')
+                peaks.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return
+        self.peaks = dict(zip(keys, peaks))
+
+    def save(self):
+        keys = list(self.peaks)
+        if len(keys) > MAX_ENTRIES:
+            keys.sort(key=self.peaks.__getitem__, reverse=True)
+            del keys[MAX_ENTRIES:]
+
+        def write(f):
+            f.write(HEADER.pack(MAGIC, BYTE_ORDER, len(keys)))
+            array.array('Q', keys).tofile(f)
+            array.array('I', [self.peaks[key] for key in keys]).tofile(f)
+        write_atomically(self.path, write)
+
+    def record(self, key, peak):
+        self.peaks[key] = min(peak // 1024, 0xffffffff)
+
+class MemorySampler(object):
+    def __init__(self, history):
+        self.history = history
+        self.ninja_pids = [] # of every ninja building
+        self.next_sample = time.monotonic()
+        self.edge_pids = {} # pid -> id of the edge it runs or None
+        self.peaks = {} # edge id -> peak RSS in bytes
+        self.peak_total = 0 # of all running edges at the same time
+
+        # (jobs, ninja's default, available memory, heaviest job) if -j was limited:
+        self.decision = None
+
+    def choose_parallelism(self, planned=None):
+        """Returns the number of jobs to run if it should be lower than ninja's default.
+
+        planned() returns the outputs of the edges the build will run, None if they're unknown.
+        It's only called if the heaviest jobs of previous builds wouldn't fit.
+        """
+        default = default_parallelism()
+        available = available_memory()
+        heaviest = heapq.nlargest(default, self.history.peaks.values())
+        if available is None or len(heaviest) < default:
+            return None # we don't know enough about the jobs yet
+        budget = available * (1 - RESERVE)
+        if jobs_fitting(heaviest, budget) >= default:
+            return None
+        outputs = planned() if planned is not None else None
+        if outputs is not None:
+            peaks = self.history.peaks
+            # Jobs which haven't been seen yet are expected to be light:
+            heaviest = heapq.nlargest(default, (peaks[key] for key in map(output_key, outputs)
+                                                if key in peaks))
+        jobs = jobs_fitting(heaviest, budget)
+        if jobs >= len(heaviest):
+            return None
+        jobs = max(jobs, 1)
+        self.decision = (jobs, default, available, heaviest[0] * 1024)
+        return jobs
+
+    def sample(self, running):
+        """Updates the peak RSS of the edges in running, a dict of ids -> RunningEdge."""
+        self.next_sample = time.monotonic() + SAMPLE_INTERVAL
+        if not self.ninja_pids or not running:
+            return
+        try:
+            processes = read_processes(self.ninja_pids)
+        except OSError:
+            self.ninja_pids = [] # no procfs
+            return
+        children = {}
+        for pid, (parent, _) in processes.items():
+            children.setdefault(parent, []).append(pid)
+
+        def subtree_rss(pid):
+            rss = 0
+            stack = [pid]
+            while stack:
+                pid = stack.pop()
+                rss += processes[pid][1]
+                stack.extend(children.get(pid, ()))
+            return rss
+
+        unassigned = None
+        edge_pids = {}
+        total = 0
+        stack = [pid for ninja_pid in self.ninja_pids for pid in children.get(ninja_pid, ())]
+        while stack:
+            pid = stack.pop()
+            if pid in self.edge_pids:
+                edge_id = self.edge_pids[pid]
+            else:
+                edge_id = None
+                command = read_command(pid)
+                if command is not None:
+                    if unassigned is None:
+                        assigned = set(self.edge_pids.values())
+                        unassigned = {}
+                        for edge in running.values():
+                            if edge.id not in assigned:
+                                unassigned.setdefault(edge.command, []).append(edge.id)
+                    ids = unassigned.get(command)
+                    if ids:
+                        edge_id = ids.pop(0)
+            edge_pids[pid] = edge_id
+            if edge_id is None or edge_id not in running:
+                stack.extend(children.get(pid, ())) # e.g. the shell ninja runs in
+                continue
+            rss = subtree_rss(pid)
+            total += rss
+            if rss > self.peaks.get(edge_id, 0):
+                self.peaks[edge_id] = rss
+        self.edge_pids = edge_pids # forgets processes which have exited
+        self.peak_total = max(self.peak_total, total)
+
+    def edge_finished(self, edge, status):
+        peak = self.peaks.pop(edge.id, None)
+        if peak is not None and status == 0 and edge.output:
+            self.history.record(output_key(edge.output), peak)
+
+    def build_started(self):
+        self.peaks = {}
+        self.edge_pids = {}
+        self.peak_total = 0
+
+    def lines(self):
+        """Summary of the memory usage for the end of the build."""
+        lines = []
+        if self.decision is not None:
+            jobs, default, available, heaviest = self.decision
+            lines.append('\x1b[1;33mran {} instead of {} jobs in parallel: {} of memory were '
+                         'available, the heaviest job needs {}\x1b[0m'.format(
+                             jobs, default, format_bytes(available), format_bytes(heaviest)))
+        if self.peak_total > 0:
+            lines.append('jobs used at most {} of memory at the same time'.format(
+                format_bytes(self.peak_total)))
+        return lines
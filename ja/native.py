@@ -3,16 +3,21 @@
 from __future__ import print_function
 
 import collections
-import ctypes
+import heapq
 import os
 import re
+import select
+import signal
 import struct
 import sys
 import datetime
+import time
+import unicodedata
 from zlib import adler32
-import humanize
 import click
 from ja import frontend
+from ja.history import output_key
+from ja.log import format_millis
 
 class SlidingRateInfo(object):
     def __init__(self, n=32):
@@ -32,36 +37,217 @@ class SlidingRateInfo(object):
         if self.times[-1] != self.times[0]:
             self.rate = len(self.times) / ((self.times[-1] - self.times[0]) / 1e3)
 
+def format_finished_rate(status):
+    if status.time_millis > 0:
+        return '{:.1f}'.format(status.finished_edges / (status.time_millis / 1e3))
+    return '?'
+
+def format_current_rate(status):
+    status.current_rate.update_rate(status.finished_edges, status.time_millis)
+    if status.current_rate.rate == -1:
+        return '?'
+    return '{:.1f}'.format(status.current_rate.rate)
+
+class ProgressStatusFormat(object):
+    """$NINJA_STATUS compiled into a list of literal strings and placeholder functions.
+
+    Raises ValueError for invalid templates, so that they're reported before the build starts.
+    """
+
+    PLACEHOLDERS = {
+        's': lambda status: str(status.started_edges),
+        't': lambda status: str(status.total_edges),
+        'r': lambda status: str(status.running_edges),
+        'u': lambda status: str(status.total_edges - status.started_edges),
+        'f': lambda status: str(status.finished_edges),
+        'o': format_finished_rate,
+        'c': format_current_rate,
+        'p': lambda status: '{:3d}%'.format((100 * status.finished_edges) // status.total_edges),
+        'e': lambda status: '{:.3f}'.format(status.time_millis / 1e3),
+    }
+
+    def __init__(self, fmt):
+        self.parts = []
+        literal = ''
+        fmt_iter = iter(fmt)
+        for c in fmt_iter:
+            if c != '%':
+                literal += c
+                continue
+            c = next(fmt_iter, None)
+            if c is None:
+                raise ValueError("$NINJA_STATUS ends with an incomplete placeholder '%'")
+            if c == '%':
+                literal += c
+                continue
+            if c == 'a':
+                placeholder = self.format_eta
+            elif c in self.PLACEHOLDERS:
+                placeholder = self.PLACEHOLDERS[c]
+            else:
+                raise ValueError("unknown placeholder '%{}' in $NINJA_STATUS".format(c))
+            if literal:
+                self.parts.append(literal)
+                literal = ''
+            self.parts.append(placeholder)
+        if literal:
+            self.parts.append(literal)
+
+        # Cache for %a, as humanizing is slow and the text only changes every few seconds:
+        self.eta_key = None
+        self.eta_text = ''
+
+    def format(self, status):
+        return ''.join([part if part.__class__ is str else part(status) for part in self.parts])
+
+    def format_eta(self, status):
+        millis = status.remaining_millis()
+        if millis is None:
+            return '{} jobs'.format(status.total_edges)
+        seconds = millis / 1e3
+        # Below a minute humanize shows seconds, then minutes, hours and days:
+        if seconds < 60:
+            key = int(seconds)
+        elif seconds < 3600:
+            key = 60 * int(seconds / 60)
+        elif seconds < 86400:
+            key = 3600 * int(seconds / 3600)
+        else:
+            key = 86400 * int(seconds / 86400)
+        if key != self.eta_key:
+            import humanize
+            self.eta_key = key
+            self.eta_text = 'ETA: ' + humanize.naturaldelta(datetime.timedelta(seconds=seconds))
+        return self.eta_text
+
 strip_ansi_re = re.compile(r'\x1B\[[^a-zA-Z]*[a-zA-Z]')
 def strip_ansi_escape_codes(output):
     return strip_ansi_re.sub('', output)
 
-relative_path_re = re.compile(r' \033\[01m\033\[K../')
-relative_path_start_re = re.compile(r'^\033\[01m\033\[K../')
+# Bold "../" at the start of a line or after a space, as GCC prints relative paths. Matching the
+# literal first and looking behind afterwards lets the regex engine skip ahead quickly.
+relative_path_re = re.compile(r'\033\[01m\033\[K\.\./(?<![^ \n]\033\[01m\033\[K\.\./)')
 def fix_relative_path_gcc(output):
-    lines = []
-    for line in output.split('\n'):
-        lines.append(relative_path_start_re.sub('\033[01m\033[K', line))
-    return relative_path_re.sub(' \033[01m\033[K', '\n'.join(lines))
+    return relative_path_re.sub('\033[01m\033[K', output)
+
+# Output of a job shown on the terminal at most, the rest is only written to a log file.
+MAX_OUTPUT_LINES = 200
+MAX_OUTPUT_CHARS = 64 * 1024
+
+# Directory inside the build directory for the full output of jobs which printed too much.
+OUTPUT_LOG_DIR = '.ja_logs'
+
+# Slow jobs listed at most after the build.
+MAX_SLOW_EDGES_SHOWN = 10
+
+partial_escape_re = re.compile(r'\x1b[^a-zA-Z]*\Z')
+def output_head_length(output, max_lines, max_chars=MAX_OUTPUT_CHARS):
+    """Length of the part of output that is shown on the terminal: at most max_lines lines (0 for
+    all of them) and max_chars characters, cut after a newline if possible.
+    """
+    if max_lines <= 0:
+        return len(output)
+    end = min(len(output), max_chars)
+    cut = 0
+    for _ in range(max_lines):
+        newline = output.find('\n', cut, end)
+        if newline == -1:
+            if end == len(output):
+                return end
+            if cut == 0:
+                # A single huge line, don't cut through an escape code:
+                match = partial_escape_re.search(output, max(end - 32, 0), end)
+                cut = match.start() if match else end
+            break
+        cut = newline + 1
+    return cut
+
+class RunningEdge(object):
+    """The fields of an EdgeStarted message needed while the edge is running. The message itself
+    has all inputs and outputs, which for link steps can be thousands of paths.
+    """
+
+    __slots__ = ('id', 'start_time', 'desc', 'command', 'console', 'output', 'key', 'expected',
+                 'slow_at', 'slow')
+
+    def __init__(self, edge_started):
+        self.id = edge_started.id
+        self.start_time = edge_started.start_time
+        self.desc = edge_started.desc
+        self.command = edge_started.command
+        self.console = edge_started.console
+        # First output or '', names the edge e.g. for log files:
+        self.output = edge_started.outputs[0] if edge_started.outputs else ''
+        # Key of the output in the DurationHistory and the duration it expects, or None.
+        self.key = None
+        self.expected = None
+        # Time at which it runs for unusually long or None, and whether that time has come (see
+        # NinjaNativeFrontend.check_slow_edges):
+        self.slow_at = None
+        self.slow = False
 
 class NinjaNativeFrontend:
-    def __init__(self):
+    # Seconds between redraws of the status line while no messages arrive.
+    TICK_INTERVAL = 1
+
+    def __init__(self, refresh_rate=None, history=None, trace=None, report=None, printer=None):
         self.total_edges = 0
         self.running_edges = 0
         self.started_edges = 0
         self.finished_edges = 0
+        # Edge id -> RunningEdge, oldest first.
         self.running = collections.OrderedDict()
-        self.last_started_edge = None
+
+        # Edge shown in the status line.
+        self.status_edge = None
 
         self.time_millis = 0
 
-        self.progress_status_format = os.getenv('NINJA_STATUS', ' %a ')
+        # DurationHistory of previous builds or None.
+        self.history = history
+
+        # TraceWriter or None.
+        self.trace = trace
+
+        # BuildReport or None.
+        self.report = report
+
+        # MemorySampler or None.
+        self.memory = None
+
+        # InputIndex or None.
+        self.rebuilds = None
+
+        # CompilerCacheStats or None.
+        self.compiler_cache = None
+
+        # Milliseconds after which any edge is slow, None to only compare with the history.
+        self.slow_timeout = None
+        # Heap of (time at which the edge becomes slow, edge id) of running edges.
+        self.slow_heap = []
+        # Edge id -> RunningEdge of the running edges which are slow, oldest first.
+        self.slow_running = collections.OrderedDict()
+        # (RunningEdge, duration) of the finished edges which were slow.
+        self.slow_finished = []
+
+        # Sum of the durations of the finished edges of this build.
+        self.finished_work = 0
+        self.parallelism = 1
+
+        # Lines of the output of a job shown at most, 0 shows all of them.
+        self.max_output_lines = MAX_OUTPUT_LINES
+
+        self.progress_status = ProgressStatusFormat(os.getenv('NINJA_STATUS', ' %a '))
         self.current_rate = SlidingRateInfo()
         self.console_locked = False
 
-        self.printer = LinePrinter()
+        # LinePrinter, shared when showing another build first.
+        self.printer = printer or LinePrinter(refresh_rate)
         self.verbose = False
 
+        # File descriptor which makes wait_for_input return early when it becomes readable.
+        self.interrupt_fd = None
+
     def handle(self, msg):
         handled = False
         edge_failed = False
@@ -73,41 +259,73 @@ class NinjaNativeFrontend:
             handled = True
             self.verbose = msg.build_started.verbose
             self.current_rate = SlidingRateInfo(msg.build_started.parallelism)
+            self.parallelism = max(msg.build_started.parallelism, 1)
             self.running_edges = 0
             self.started_edges = 0
             self.finished_edges = 0
-            self.running = {}
+            self.finished_work = 0
+            self.running = collections.OrderedDict()
+            self.slow_heap = []
+            self.slow_running = collections.OrderedDict()
+            self.slow_finished = []
+            if self.history is not None:
+                self.history.start_build()
+            if self.report is not None:
+                self.report.build_started(msg.build_started.parallelism)
+            if self.memory is not None:
+                self.memory.build_started()
+            if self.rebuilds is not None:
+                self.rebuilds.build_started()
 
         if msg.HasField("build_finished"):
             handled = True
             self.printer.set_console_locked(False)
-
-            hours = int(self.time_millis / (3600 * 1e3))
-            minutes = int((self.time_millis % (3600 * 1e3)) / (60 * 1e3))
-            seconds = (self.time_millis % (60 * 1e3)) / 1e3
-            if hours > 0:
-                time_passed = '{}h{}m{}s'.format(hours, minutes, int(seconds))
-            elif minutes > 0:
-                time_passed = '{}m{}s'.format(minutes, int(seconds))
-            else:
-                time_passed = '{:.3f}s'.format(seconds)
+            self.build_stopped()
             self.printer.print_line("\x1b[1;32mfinished {} job{} in {}.\x1b[0m".format(
                 self.total_edges,
                 's' if self.total_edges != 1 else '',
-                time_passed
+                format_millis(self.time_millis, precise=True)
             ), LinePrinter.LINE_FULL)
+            if self.compiler_cache is not None:
+                for line in self.compiler_cache.lines():
+                    self.printer.print_line(line, LinePrinter.LINE_FULL)
+            if self.report is not None:
+                for line in self.report.lines(self.time_millis):
+                    self.printer.print_line(line, LinePrinter.LINE_FULL)
+            if self.memory is not None:
+                for line in self.memory.lines():
+                    self.printer.print_line(line, LinePrinter.LINE_FULL)
+            for line in self.slow_edges_summary():
+                self.printer.print_line(line, LinePrinter.LINE_FULL)
 
         if msg.HasField("edge_started"):
             handled = True
             self.started_edges += 1
             self.running_edges += 1
-            self.running[msg.edge_started.id] = msg.edge_started
-            self.last_started_edge = msg.edge_started
-            self.time_millis = msg.edge_started.start_time
-            if msg.edge_started.console or self.printer.smart_terminal:
+            edge = RunningEdge(msg.edge_started)
+            self.running[edge.id] = edge
+            self.time_millis = edge.start_time
+            slow_after = self.slow_timeout
+            if self.history is not None and edge.output:
+                edge.key = output_key(edge.output)
+                edge.expected = self.history.edge_started(edge.key)
+                if edge.expected is not None:
+                    unusual = self.history.slow_after(edge.key)
+                    slow_after = unusual if slow_after is None else min(slow_after, unusual)
+            if slow_after is not None:
+                edge.slow_at = edge.start_time + slow_after
+                heapq.heappush(self.slow_heap, (edge.slow_at, edge.id))
+            self.check_slow_edges()
+            if self.trace is not None:
+                self.trace.edge_started(msg.edge_started)
+            if self.report is not None:
+                self.report.edge_started(msg.edge_started)
+            if self.rebuilds is not None:
+                self.rebuilds.edge_started(msg.edge_started)
+            if edge.console or self.printer.smart_terminal:
                 # Hide progress bar for console pool jobs as we can't refresh it:
-                self.print_status(msg.edge_started, not msg.edge_started.console)
-            if msg.edge_started.console:
+                self.print_status(edge, not edge.console)
+            if edge.console:
                 self.printer.set_console_locked(True)
 
         if msg.HasField("edge_finished"):
@@ -115,16 +333,32 @@ class NinjaNativeFrontend:
             self.finished_edges += 1
             self.time_millis = msg.edge_finished.end_time
 
-            edge_started = self.running[msg.edge_finished.id]
-
-            if edge_started.console:
+            edge = self.running.pop(msg.edge_finished.id)
+            duration = msg.edge_finished.end_time - edge.start_time
+            if edge.slow:
+                del self.slow_running[edge.id]
+            if edge.slow_at is not None and edge.slow_at <= self.time_millis:
+                self.slow_finished.append((edge, duration))
+            self.check_slow_edges()
+            self.finished_work += duration
+            if edge.key is not None and msg.edge_finished.status == 0:
+                self.history.record(edge.key, duration)
+            if self.trace is not None:
+                self.trace.edge_finished(edge, msg.edge_finished)
+            if self.report is not None:
+                self.report.edge_finished(edge, msg.edge_finished)
+            if self.memory is not None:
+                self.memory.edge_finished(edge, msg.edge_finished.status)
+            if self.rebuilds is not None:
+                self.rebuilds.edge_finished(edge, msg.edge_finished)
+
+            if edge.console:
                 self.printer.set_console_locked(False)
 
-            if not edge_started.console:
-                self.print_status(edge_started)
+            if not edge.console:
+                self.print_status(edge)
 
             self.running_edges -= 1
-            del self.running[msg.edge_finished.id]
 
             template = '\x1b[1;34m{}\x1b[0m' if msg.edge_finished.output != '' else None
             if msg.edge_finished.status != 0:
@@ -136,7 +370,7 @@ class NinjaNativeFrontend:
                 self.printer.print_line('', LinePrinter.LINE_ELIDE)
                 if self.verbose or msg.edge_finished.output == '':
                     # Print the command that is spewing before printing its output.
-                    self.printer.print_line(template.format(edge_started.command),
+                    self.printer.print_line(template.format(edge.command),
                                             LinePrinter.LINE_FULL)
 
                 # ninja sets stdout and stderr of subprocesses to a pipe, to be able to
@@ -151,19 +385,29 @@ class NinjaNativeFrontend:
                 # only a few hundred available on some systems, and ninja can launch
                 # thousands of parallel compile commands.)
                 # TODO: There should be a flag to disable escape code stripping.
+                #
+                # Only the head of huge outputs is processed and printed. Stripping removes the
+                # escape codes fix_relative_path_gcc looks for, so each needs just one scan.
+                output = msg.edge_finished.output
+                end = len(output)
+                # The build output contains a trailing newline most of the time which isn't
+                # needed:
+                while end > 0 and output[end - 1] == '\n':
+                    end -= 1
+                cut = min(output_head_length(output, self.max_output_lines), end)
+                head = output[:cut]
                 if not self.printer.smart_terminal and os.getenv("CLICOLOR_FORCE", "0") == "0":
-                    msg.edge_finished.output = strip_ansi_escape_codes(msg.edge_finished.output)
-
-                msg.edge_finished.output = fix_relative_path_gcc(msg.edge_finished.output)
-
-                # rstrp('\n') because the build output contains a trailing newline most of the time
-                # which isn't needed:
-                self.printer.print_line(msg.edge_finished.output.rstrip('\n'), LinePrinter.LINE_FULL)
+                    head = strip_ansi_escape_codes(head)
+                else:
+                    head = fix_relative_path_gcc(head)
+                self.printer.print_line(head.rstrip('\n'), LinePrinter.LINE_FULL)
+                if cut < end:
+                    self.print_output_log(edge, output, output.count('\n', cut, end) + 1)
 
             # We wouldn't want to print the status for an edge that has finished, therefore reprint
             # the status line with an edge that is running:
             if not edge_failed and self.running:
-                running_edge = list(self.running.values())[0]
+                running_edge = next(iter(self.running.values())) # the oldest one
                 if running_edge.console or self.printer.smart_terminal:
                     self.print_status(running_edge)
                 if running_edge.console:
@@ -190,64 +434,203 @@ class NinjaNativeFrontend:
         if not handled:
             pass
 
+        # The caller decides whether to stop following the build after a failure, and then calls
+        # build_stopped():
         return edge_failed
 
+    def print_output_log(self, edge, output, hidden_lines):
+        """Writes the full output of an edge to a file in OUTPUT_LOG_DIR and prints its path."""
+        if edge.output:
+            name = edge.output.replace('/', '_').replace('\\', '_')[-200:]
+        else:
+            name = 'edge{}'.format(edge.id)
+        path = os.path.join(OUTPUT_LOG_DIR, name + '.log')
+        hidden = '{} more line{}'.format(hidden_lines, 's' if hidden_lines != 1 else '')
+        try:
+            os.makedirs(OUTPUT_LOG_DIR, exist_ok=True)
+            with open(path, 'w', encoding='utf-8', errors='replace') as f:
+                f.write(output)
+        except OSError as err:
+            self.printer.print_line('\x1b[1;33m{} not shown, writing the full output to {} failed: '
+                                    '{}\x1b[0m'.format(hidden, path, err.strerror),
+                                    LinePrinter.LINE_FULL)
+            return
+        self.printer.print_line('\x1b[1;33m{}, see {}\x1b[0m'.format(hidden, os.path.abspath(path)),
+                                LinePrinter.LINE_FULL)
+
+    def build_stopped(self):
+        """Called when the build has finished or ja stops following it."""
+        if self.history is not None:
+            self.history.save()
+        if self.memory is not None:
+            self.memory.history.save()
+        if self.rebuilds is not None:
+            self.rebuilds.save()
+        if self.trace is not None:
+            self.trace.close()
+
+    def remaining_millis(self):
+        """Predicts how long the build will still take, None if there's no data yet."""
+        if self.history is None:
+            if self.finished_edges == 0:
+                return None
+            return self.time_millis / self.finished_edges * (self.total_edges - self.finished_edges)
+
+        history = self.history
+        if self.finished_edges > 0:
+            average = self.finished_work / self.finished_edges
+        elif history.unstarted_count > 0:
+            average = history.unstarted_work / history.unstarted_count
+        else:
+            return None
+
+        # Running edges still take their expected duration minus the time they've been running:
+        running_work = 0
+        longest = 0
+        for edge in self.running.values():
+            expected = average if edge.expected is None else edge.expected
+            left = expected - (self.time_millis - edge.start_time)
+            if left > 0:
+                running_work += left
+                longest = max(longest, left)
+
+        # We don't know which edges ninja will start next. If the history knows more edges than
+        # there are left, assume the average of them (a full rebuild matches exactly):
+        unstarted = self.total_edges - self.started_edges
+        if unstarted <= 0:
+            unstarted_work = 0
+        elif history.unstarted_count >= unstarted:
+            unstarted_work = history.unstarted_work * unstarted / history.unstarted_count
+        else:
+            unstarted_work = history.unstarted_work + \
+                             (unstarted - history.unstarted_count) * average
+
+        return max((running_work + unstarted_work) / self.parallelism, longest)
+
+
+    def wait_for_input(self, reader):
+        """Called by Frontend before it reads from reader. Until reader becomes readable, draws
+        status lines held back by the refresh rate, redraws the status line after the terminal
+        has been resized and once per TICK_INTERVAL, so that times and ETA keep running. Also
+        samples the memory of running edges and returns when interrupt_fd becomes readable.
+        reader can also be a list of readers, of which one has to become readable.
+        """
+        printer = self.printer
+        memory = self.memory
+        if memory is not None and time.monotonic() >= memory.next_sample:
+            memory.sample(self.running) # even if messages keep arriving
+        if not printer.smart_terminal and self.interrupt_fd is None and memory is None:
+            return
+        try:
+            reader_fds = [r.fileno() for r in (reader if isinstance(reader, list) else [reader])]
+        except (AttributeError, OSError, ValueError):
+            printer.flush() # not selectable
+            return
+        fds = list(reader_fds)
+        if self.interrupt_fd is not None:
+            fds.append(self.interrupt_fd)
+        if printer.smart_terminal and printer.wakeup_fd is not None:
+            fds.append(printer.wakeup_fd)
+
+        # Messages arrived until now, so ninja's clock is roughly self.time_millis:
+        since = time.monotonic()
+        time_millis = self.time_millis
+        next_tick = since + self.TICK_INTERVAL if printer.smart_terminal else None
+        while True:
+            deadline = next_tick
+            if next_tick is not None and printer.pending_line is not None:
+                deadline = min(deadline, printer.next_frame)
+            if memory is not None:
+                deadline = memory.next_sample if deadline is None else \
+                           min(deadline, memory.next_sample)
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            readable = select.select(fds, [], [], timeout)[0]
+            if any(fd in readable for fd in reader_fds) or self.interrupt_fd in readable:
+                return
+            now = time.monotonic()
+            if memory is not None and now >= memory.next_sample:
+                memory.sample(self.running)
+            if next_tick is None:
+                continue # nothing to draw on dumb terminals
+            if printer.wakeup_fd in readable:
+                try:
+                    while os.read(printer.wakeup_fd, 64):
+                        pass
+                except BlockingIOError:
+                    pass
+                printer.redraw()
+            if printer.pending_line is not None and now >= printer.next_frame:
+                printer.flush()
+            if now >= next_tick:
+                next_tick = now + self.TICK_INTERVAL
+                self.time_millis = time_millis + int((now - since) * 1000)
+                self.tick()
+
+    def check_slow_edges(self):
+        """Marks the running edges which have become slow by now."""
+        heap = self.slow_heap
+        while heap and heap[0][0] <= self.time_millis:
+            edge = self.running.get(heapq.heappop(heap)[1])
+            if edge is None:
+                continue # finished in time
+            edge.slow = True
+            self.slow_running[edge.id] = edge
+            if not self.printer.smart_terminal:
+                # There's no status line to show it in:
+                self.printer.print_line('\x1b[1;33mstill running after {}{}: {}\x1b[0m'.format(
+                    format_millis(self.time_millis - edge.start_time), self.format_usual(edge),
+                    edge.desc or edge.command), LinePrinter.LINE_FULL)
+
+    def format_usual(self, edge):
+        if edge.expected is None:
+            return ''
+        return ', usually {}'.format(format_millis(edge.expected))
+
+    def slow_edges_summary(self):
+        slow = sorted(self.slow_finished, key=lambda item: -item[1])
+        if not slow:
+            return []
+        lines = ['\x1b[1;33m{} job{} took unusually long:\x1b[0m'.format(
+            len(slow), 's' if len(slow) != 1 else '')]
+        for edge, duration in slow[:MAX_SLOW_EDGES_SHOWN]:
+            lines.append('  {}: {}{}'.format(edge.desc or edge.command, format_millis(duration),
+                                             self.format_usual(edge)))
+        if len(slow) > MAX_SLOW_EDGES_SHOWN:
+            lines.append('  and {} more'.format(len(slow) - MAX_SLOW_EDGES_SHOWN))
+        return lines
+
+    def tick(self):
+        self.check_slow_edges()
+        edge = self.status_edge
+        if self.verbose or self.printer.console_locked or edge is None or \
+           edge.id not in self.running:
+            return
+        self.print_status(edge)
 
-    def format_progress_status(self, fmt):
-        out = ''
-        fmt_iter = iter(fmt)
-        for c in fmt_iter:
-            if c == '%':
-                c = next(fmt_iter)
-                if c == '%':
-                    out += c
-                elif c == 's':
-                    out += str(self.started_edges)
-                elif c == 't':
-                    out += str(self.total_edges)
-                elif c == 'r':
-                    out += str(self.running_edges)
-                elif c == 'u':
-                    out += str(self.total_edges - self.started_edges)
-                elif c == 'f':
-                    out += str(self.finished_edges)
-                elif c == 'o':
-                    if self.time_millis > 0:
-                        rate = self.finished_edges / (self.time_millis / 1e3)
-                        out += '{:.1f}'.format(rate)
-                    else:
-                        out += '?'
-                elif c == 'c':
-                    self.current_rate.update_rate(self.finished_edges, self.time_millis)
-                    if self.current_rate.rate == -1:
-                        out += '?'
-                    else:
-                        out += '{:.1f}'.format(self.current_rate.rate)
-                elif c == 'p':
-                    out += '{:3d}%'.format((100 * self.finished_edges) // self.total_edges)
-                elif c == 'e':
-                    out += '{:.3f}'.format(self.time_millis / 1e3)
-                elif c == 'a':
-                    if self.finished_edges > 0:
-                        out += 'ETA: ' + humanize.naturaldelta(
-                            datetime.timedelta(seconds=self.time_millis / self.finished_edges * \
-                            (self.total_edges - self.finished_edges) / 1e3)
-                        )
-                    else:
-                        out += '{} jobs'.format(self.total_edges)
-                else:
-                    raise Exception('unknown placeholder '' + c +'' in $NINJA_STATUS')
-            else:
-                out += c
-        out = '{:17}'.format(out)
+    def format_progress_status(self):
+        out = '{:17}'.format(self.progress_status.format(self))
         bar_end = round((len(out) * self.finished_edges) / self.total_edges)
         return '\x1b[0;36m▕\x1b[1;37;46m' + out[:bar_end] + '\x1b[0m\x1b[1m' + out[bar_end:] + \
                '\x1b[0;36m▏\x1b[0m'
 
-    def print_status(self, edge_started, progress_bar=True):
-        to_print = edge_started.desc
+    def print_status(self, edge, progress_bar=True):
+        if self.slow_running and not edge.console:
+            edge = next(iter(self.slow_running.values())) # rather than one which runs as usual
+        self.status_edge = edge
+        if self.verbose:
+            self.printer.print_line(self.format_status(edge, progress_bar), LinePrinter.LINE_FULL)
+        else:
+            # Most status lines are held back by the refresh rate, only format the ones which are
+            # drawn:
+            self.printer.print_line(lambda: self.format_status(edge, progress_bar),
+                                    LinePrinter.LINE_ELIDE)
+
+    def format_status(self, edge, progress_bar):
+        to_print = edge.desc
         if self.verbose or to_print == '':
-            to_print = '\x1b[1m{}\x1b[0m'.format(edge_started.command)
+            to_print = '\x1b[1m{}\x1b[0m'.format(edge.command)
+        elif edge.slow:
+            to_print = '\x1b[1;33m{}\x1b[0m'.format(to_print)
         else:
             words = to_print.split(' ')
             try:
@@ -260,44 +643,109 @@ class NinjaNativeFrontend:
             )
 
         if progress_bar and not self.verbose and self.total_edges != 1: # No need for a progress bar if there's only one edge
-            to_print = self.format_progress_status(self.progress_status_format) + to_print
+            to_print = self.format_progress_status() + to_print
+
+        elapsed = (self.time_millis - edge.start_time) // 1000
+        if edge.slow and progress_bar and not self.verbose:
+            to_print += ' \x1b[1;33m{}{}\x1b[0m'.format(
+                format_millis(self.time_millis - edge.start_time), self.format_usual(edge))
+        elif progress_bar and not self.verbose and elapsed > 0:
+            if elapsed >= 60:
+                to_print += ' \x1b[2m{}m{:02}s\x1b[0m'.format(elapsed // 60, elapsed % 60)
+            else:
+                to_print += ' \x1b[2m{}s\x1b[0m'.format(elapsed)
+        return to_print
 
-        self.printer.print_line(to_print, LinePrinter.LINE_FULL if self.verbose else LinePrinter.LINE_ELIDE)
 
+def render_line(line):
+    """Returns line, or what it returns if it's a function, see LinePrinter.print_line."""
+    return line() if callable(line) else line
+
+# Splits a string into text (even indices) and escape codes (odd indices):
+ansi_escape_split_re = re.compile(r'(\x1b[^m]*m)')
+
+def char_width(c):
+    """Number of terminal columns c occupies."""
+    if unicodedata.combining(c):
+        return 0
+    return 2 if unicodedata.east_asian_width(c) in ('W', 'F') else 1
+
+def text_width(text):
+    if text.isascii():
+        return len(text)
+    return sum(map(char_width, text))
 
-ansi_escape = re.compile(r'\x1b[^m]*m')
 def elide_middle(status, width):
+    """Replaces the middle of status with "…" so that it fits into width terminal columns.
+
+    ANSI escape codes don't take up columns and are all kept, the ones from the elided part are
+    put right after the "…". Wide characters (e.g. CJK) take up two columns.
+    """
     margin = 1 # Space for "…".
-    status_stripped = ansi_escape.sub('', status)
-    if len(status_stripped) + margin > width:
-        elide_size = (width - margin) // 2
-
-        escapes = []
-        added_len = 0 # total number of characters
-        for m in ansi_escape.finditer(status):
-            escapes += [(m.start() - added_len, m.group())]
-            added_len += len(m.group())
-
-        status = status_stripped[0:elide_size] + "…" + status_stripped[-elide_size:]
-
-        added_len = 0
-        # We need to put all ANSI escape codes back in:
-        for escape in escapes:
-            pos = escape[0]
-            if pos > elide_size:
-                pos -= len(status_stripped) - width
-                if pos < width - elide_size:
-                    pos = width - elide_size
-            pos += added_len
-            status = status[:pos] + escape[1] + status[pos:]
-            added_len += len(escape[1])
-    return status
+    if width <= margin:
+        return status # terminal width unknown
+    if status.isascii() and len(status) + margin <= width:
+        return status
+    parts = ansi_escape_split_re.split(status) if '\x1b' in status else [status]
+    if text_width(''.join(parts[::2])) + margin <= width:
+        return status
+
+    elide_size = (width - margin) // 2
+
+    # Find where the kept head ends: parts[head_part][:head_pos] is its last piece of text.
+    head_part = head_pos = 0
+    cols = 0
+    for head_part in range(0, len(parts), 2):
+        text = parts[head_part]
+        if text.isascii():
+            if cols + len(text) <= elide_size:
+                cols += len(text)
+                continue
+            head_pos = elide_size - cols
+            break
+        for head_pos, c in enumerate(text):
+            cols += char_width(c)
+            if cols > elide_size:
+                break
+        else:
+            continue
+        break
+
+    # Same for where the kept tail starts: parts[tail_part][tail_pos:] is its first piece of text.
+    tail_part = tail_pos = 0
+    cols = 0
+    for tail_part in range(len(parts) - 1, -1, -2):
+        text = parts[tail_part]
+        if text.isascii():
+            if cols + len(text) <= elide_size:
+                cols += len(text)
+                continue
+            tail_pos = len(text) - (elide_size - cols)
+            break
+        for tail_pos in range(len(text), 0, -1):
+            cols += char_width(text[tail_pos - 1])
+            if cols > elide_size:
+                break
+        else:
+            continue
+        break
+
+    out = parts[:head_part]
+    out.append(parts[head_part][:head_pos])
+    out.append('…')
+    out.extend(parts[head_part + 1:tail_part:2]) # escape codes from the elided middle
+    out.append(parts[tail_part][tail_pos:])
+    out.extend(parts[tail_part + 1:])
+    return ''.join(out)
 
 class LinePrinter(object):
     LINE_FULL = 1
     LINE_ELIDE = 2
 
-    def __init__(self):
+    # Default number of status line redraws per second.
+    REFRESH_RATE = 30
+
+    def __init__(self, refresh_rate=None):
         # Whether we can do fancy terminal control codes.
         self.smart_terminal = False
 
@@ -316,7 +764,29 @@ class LinePrinter(object):
         # Buffered console output while console is locked.
         self.output_buffer = ''
 
+        # Minimum time between two redraws of the status line, 0 redraws on every update.
+        if refresh_rate is None:
+            refresh_rate = self.REFRESH_RATE
+        self.frame_interval = 1 / refresh_rate if refresh_rate > 0 else 0
+
+        # time.monotonic() after which the status line may be redrawn.
+        self.next_frame = 0
+
+        # Latest status line that has been held back because of the refresh rate.
+        self.pending_line = None
+
+        # Status line which is currently shown, None after a FULL line.
+        self.last_status = None
+
+        # Width of the terminal, kept up to date by a SIGWINCH handler.
+        self.width = 80
+
+        # Read end of the pipe signal.set_wakeup_fd writes to, so that waiting for input can be
+        # interrupted to redraw the status line after the terminal has been resized.
+        self.wakeup_fd = None
+
         if os.name == 'windows':
+            import ctypes
             STD_OUTPUT_HANDLE = -11
             self.console = ctypes.windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
             csbi = ctypes.create_string_buffer(22)
@@ -324,43 +794,89 @@ class LinePrinter(object):
         else:
             term = os.getenv('TERM')
             self.smart_terminal = os.isatty(1) and term != '' and term != 'dumb'
+            if self.smart_terminal:
+                self.update_width()
+                try:
+                    signal.signal(signal.SIGWINCH, lambda signum, frame: self.update_width())
+                    read_fd, write_fd = os.pipe()
+                    os.set_blocking(read_fd, False)
+                    os.set_blocking(write_fd, False)
+                    signal.set_wakeup_fd(write_fd)
+                    self.wakeup_fd = read_fd
+                except ValueError:
+                    pass # not running in the main thread, keep the initial width
+
+    def update_width(self):
+        try:
+            self.width = os.get_terminal_size(1).columns
+        except OSError:
+            pass
 
     def print_line(self, to_print, line_type):
+        """to_print can also be a function returning the line, which is only called once the
+        line gets drawn."""
         if self.console_locked:
+            to_print = render_line(to_print)
             self.line_buffer = to_print
             self.line_type = line_type
 
+        if self.smart_terminal and line_type == self.LINE_ELIDE and os.name != 'windows':
+            now = time.monotonic()
+            if now < self.next_frame:
+                # Only the latest status line of a frame gets drawn, see
+                # NinjaNativeFrontend.wait_for_input.
+                self.pending_line = to_print
+                return
+            self.next_frame = now + self.frame_interval
+            self.draw_status(render_line(to_print))
+            return
+        to_print = render_line(to_print)
+
+        # A FULL line replaces the status line, so a held back one doesn't need to be drawn.
+        self.pending_line = None
+        self.last_status = None
+
         if self.smart_terminal:
             sys.stdout.write('\r') # Print over previous line, if any.
 
         if self.smart_terminal and line_type == self.LINE_ELIDE:
-            if os.name == 'windows':
-                csbi = ctypes.create_string_buffer(22)
-                ctypes.windll.kernel32.GetConsoleScreenBufferInfo(self.console, csbi)
-                (cols, rows) = struct.unpack('hh', csbi.raw)
-                to_print = elide_middle(to_print, cols)
-                # TODO: windows support
-                # We don't want to have the cursor spamming back and forth, so instead of
-                # printf use WriteConsoleOutput which updates the contents of the buffer,
-                # but doesn't move the cursor position.
-                sys.stdout.write(to_print)
-                sys.stdout.flush()
-            else:
-                # Limit output to width of the terminal if provided so we don't cause
-                # line-wrapping.
-                import fcntl, termios
-                winsize = fcntl.ioctl(0, termios.TIOCGWINSZ, '\0'*4)
-                (rows, cols) = struct.unpack('hh', winsize)
-                to_print = elide_middle(to_print, cols)
-                sys.stdout.write(to_print)
-                sys.stdout.write('\x1B[K')  # Clear to end of line.
-                sys.stdout.flush()
+            import ctypes
+            csbi = ctypes.create_string_buffer(22)
+            ctypes.windll.kernel32.GetConsoleScreenBufferInfo(self.console, csbi)
+            (cols, rows) = struct.unpack('hh', csbi.raw)
+            to_print = elide_middle(to_print, cols)
+            # TODO: windows support
+            # We don't want to have the cursor spamming back and forth, so instead of
+            # printf use WriteConsoleOutput which updates the contents of the buffer,
+            # but doesn't move the cursor position.
+            sys.stdout.write(to_print)
+            sys.stdout.flush()
 
             self.have_blank_line = False
         else:
             sys.stdout.write(to_print + "\x1B[K\n")
             sys.stdout.flush()
 
+    def draw_status(self, to_print):
+        self.pending_line = None
+        self.last_status = to_print
+        # Print over previous line, limit output to width of the terminal so we don't cause
+        # line-wrapping and clear to end of line:
+        sys.stdout.write('\r' + elide_middle(to_print, self.width) + '\x1B[K')
+        sys.stdout.flush()
+        self.have_blank_line = False
+
+    def flush(self):
+        """Draws the status line that has been held back by the refresh rate, if any."""
+        if self.pending_line is not None:
+            self.next_frame = time.monotonic() + self.frame_interval
+            self.draw_status(render_line(self.pending_line))
+
+    def redraw(self):
+        """Draws the current status line again, e.g. with a new terminal width."""
+        if self.pending_line is None and self.last_status is not None:
+            self.draw_status(self.last_status)
+
     def print_or_buffer(self, to_print):
         if self.console_locked:
             self.output_buffer += to_print
@@ -369,6 +885,7 @@ class LinePrinter(object):
             sys.stdout.flush()
 
     def print_on_new_line(self, to_print):
+        self.flush()
         if self.console_locked or self.line_buffer != '':
             self.output_buffer += self.line_buffer + '\n'
             self.line_buffer = ""
@@ -396,7 +913,7 @@ class LinePrinter(object):
 
 def main():
     native = NinjaNativeFrontend()
-    for msg in frontend.Frontend():
+    for msg in frontend.Frontend(idle=native.wait_for_input):
         native.handle(msg)
 
 if __name__ == '__main__':
@@ -0,0 +1,31 @@
+"""Starting and cancelling ninja, which writes its status stream into a FIFO read by ja."""
+
+import os
+import shlex
+import signal
+import subprocess
+
+def frontend_command(fifo):
+    """The --frontend of ninja which copies the status stream into fifo and removes it once ninja
+    has exited."""
+    return 'cat <&3 >{0}; rm -f {0}'.format(fifo)
+
+def start(build_file, fifo, args, env):
+    """Creates fifo and starts ninja in its own process group, so that Ctrl+C doesn't reach it and
+    it keeps running when ja exits. Returns its Popen."""
+    try:
+        os.remove(fifo) # left behind by a ja which has been killed
+    except FileNotFoundError:
+        pass
+    os.mkfifo(fifo)
+    return subprocess.Popen(['ninja -f {} --frontend="{}" {}'.format(
+        build_file, frontend_command(fifo), ' '.join([shlex.quote(x) for x in args]))],
+        shell=True, preexec_fn=os.setpgrp, env=env)
+
+def cancel(pid):
+    """Lets the ninja started by start() stop its jobs like Ctrl+C would. Its status stream ends
+    when it has exited."""
+    try:
+        os.killpg(pid, signal.SIGINT)
+    except OSError:
+        pass # exited already
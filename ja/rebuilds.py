@@ -0,0 +1,193 @@
+"""Which inputs cost the most build time when they're modified (`ja --analyze-rebuilds`).
+
+Every edge ja has seen finish is remembered with its duration and its inputs, which include the
+headers ninja knows from the deps log. Paths are interned: each is stored once and edges refer
+to it by a 32 bit ID in an array, so that 100k edges with thousands of inputs each stay compact.
+The index lives in the build directory and is updated with the edges of every analyzed build;
+without one, it's imported from `ninja -t deps` and the duration history.
+
+Modifying an input rebuilds the edges using it, so it costs the sum of their durations. These
+sums and the number of edges are kept per input ID in arrays next to the edges, updated whenever
+an edge is recorded again, so that the ranking doesn't have to invert 100k edges first. Inputs
+which other edges produce (e.g. object files) aren't ranked.
+"""
+
+import array
+import heapq
+import struct
+import subprocess
+
+from ja.history import output_key
+from ja.log import format_millis
+from ja.store import BYTE_ORDER, write_atomically
+
+INDEX_FILE = '.ja_inputs'
+
+# Inputs listed in the ranking.
+RANKED_INPUTS = 20
+
+# magic, byte order, number of paths, number of edges, number of inputs of all edges, size of the
+# paths in bytes (followed by the paths, the costs and edge counts per path and the edges)
+HEADER = struct.Struct('<4s1sxxxIIIQ')
+MAGIC = b'jai2'
+
+class InputIndex(object):
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.paths = [] # ID -> path
+        self.path_ids = {} # path -> ID
+        self.costs = array.array('Q') # ID -> sum of the durations of the edges using it
+        self.counts = array.array('I') # ID -> number of edges using it
+
+        # Output key -> (duration, ID of the output, array of the IDs of the inputs).
+        self.edges = {}
+
+        # Edge id -> (output key, ID of the output, array of input IDs) of running edges.
+        self.pending = {}
+
+    def intern(self, path):
+        path_id = self.path_ids.get(path)
+        if path_id is None:
+            path_id = self.path_ids[path] = len(self.paths)
+            self.paths.append(path)
+            self.costs.append(0)
+            self.counts.append(0)
+        return path_id
+
+    def load(self):
+        """Returns False if there's no index yet."""
+        try:
+            with open(self.path, 'rb') as f:
+                magic, byte_order, path_count, edge_count, input_count, paths_size = \
+                    HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC or byte_order != BYTE_ORDER:
+                    return False
+                paths = f.read(paths_size)
+                costs = array.array('Q')
+                costs.fromfile(f, path_count)
+                counts = array.array('I')
+                counts.fromfile(f, path_count)
+                keys = array.array('Q')
+                keys.fromfile(f, edge_count)
+                durations = array.array('I')
+                durations.fromfile(f, edge_count)
+                outputs = array.array('I')
+                outputs.fromfile(f, edge_count)
+                offsets = array.array('I')
+                offsets.fromfile(f, edge_count + 1)
+                inputs = array.array('I')
+                inputs.fromfile(f, input_count)
+        except (OSError, EOFError, struct.error):
+            return False
+        self.paths = paths.decode('utf-8', 'surrogateescape').split('\0') if path_count else []
+        self.path_ids = {path: path_id for path_id, path in enumerate(self.paths)}
+        self.costs = costs
+        self.counts = counts
+        self.edges = {key: (durations[i], outputs[i], inputs[offsets[i]:offsets[i + 1]])
+                      for i, key in enumerate(keys)}
+        return True
+
+    def save(self):
+        keys = array.array('Q', self.edges)
+        durations = array.array('I')
+        outputs = array.array('I')
+        offsets = array.array('I', [0])
+        inputs = array.array('I')
+        for duration, output, edge_inputs in self.edges.values():
+            durations.append(min(duration, 0xffffffff))
+            outputs.append(output)
+            inputs.extend(edge_inputs)
+            offsets.append(len(inputs))
+        paths = '\0'.join(self.paths).encode('utf-8', 'surrogateescape')
+
+        def write(f):
+            f.write(HEADER.pack(MAGIC, BYTE_ORDER, len(self.paths), len(keys), len(inputs),
+                                len(paths)))
+            f.write(paths)
+            self.costs.tofile(f)
+            self.counts.tofile(f)
+            for values in (keys, durations, outputs, offsets, inputs):
+                values.tofile(f)
+        write_atomically(self.path, write)
+
+    def import_ninja_deps(self, f, history):
+        """Fills the index from the deps log of ninja and the durations in history."""
+        try:
+            proc = subprocess.run(['ninja', '-f', f, '-t', 'deps'], stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL)
+        except OSError:
+            return
+        output = None
+        inputs = None
+        # "foo.o: #deps 2, deps mtime 123 (VALID)" followed by indented inputs:
+        for line in proc.stdout.decode('utf-8', 'surrogateescape').splitlines():
+            if line.startswith(' '):
+                if inputs is not None:
+                    inputs.append(self.intern(line.strip()))
+                continue
+            if output is not None:
+                self.add_edge(output, history, inputs)
+                output = None
+            if ': #deps' in line:
+                output = line.rsplit(': #deps', 1)[0]
+                inputs = array.array('I')
+        if output is not None:
+            self.add_edge(output, history, inputs)
+
+    def add_edge(self, output, history, inputs):
+        key = output_key(output)
+        duration = history.durations.get(key)
+        if duration is not None and inputs:
+            self.set_edge(key, duration, self.intern(output), inputs)
+
+    def set_edge(self, key, duration, output, inputs):
+        costs = self.costs
+        counts = self.counts
+        previous = self.edges.get(key)
+        if previous is not None:
+            previous_duration = previous[0]
+            for path_id in previous[2]:
+                costs[path_id] -= previous_duration
+                counts[path_id] -= 1
+        for path_id in inputs:
+            costs[path_id] += duration
+            counts[path_id] += 1
+        self.edges[key] = (duration, output, inputs)
+
+    def edge_started(self, edge_started):
+        output = edge_started.outputs[0] if edge_started.outputs else ''
+        if not output:
+            return
+        intern = self.intern
+        self.pending[edge_started.id] = (
+            output_key(output), intern(output),
+            array.array('I', [intern(path) for path in edge_started.inputs]))
+
+    def edge_finished(self, edge, edge_finished):
+        pending = self.pending.pop(edge_finished.id, None)
+        if pending is not None and edge_finished.status == 0:
+            key, output, inputs = pending
+            self.set_edge(key, edge_finished.end_time - edge.start_time, output, inputs)
+
+    def build_started(self):
+        self.pending = {}
+
+    def ranking(self, count=RANKED_INPUTS):
+        """Returns the count most expensive inputs as (cost, number of edges, path)."""
+        produced = set(output for _, output, _ in self.edges.values())
+        costs = self.costs
+        ranked = heapq.nlargest(count, (path_id for path_id in range(len(self.paths))
+                                        if self.counts[path_id] and path_id not in produced),
+                                key=costs.__getitem__)
+        return [(costs[path_id], self.counts[path_id], self.paths[path_id]) for path_id in ranked]
+
+    def lines(self):
+        ranking = self.ranking()
+        if not ranking:
+            return ['no inputs to analyze yet, rebuild everything with --analyze-rebuilds']
+        lines = ['inputs which cost the most build time when modified ({} jobs known):'.format(
+            len(self.edges))]
+        for cost, jobs, path in ranking:
+            lines.append('  {:>9}  {:>6} job{}  {}'.format(
+                format_millis(cost), jobs, 's' if jobs != 1 else ' ', path))
+        return lines
@@ -0,0 +1,121 @@
+"""End-of-build report on the critical path and on how well the jobs were parallelized.
+
+Everything is computed while the build is running, so that printing the report is instant:
+When an edge finishes, the length of the longest chain of edges ending in it is its duration
+plus the longest chain of the edges which produced its inputs. Running jobs are integrated over
+time whenever their number changes.
+"""
+
+import heapq
+
+from ja.log import format_millis
+
+# Number of starved periods listed in the report.
+STARVED_PERIODS = 5
+
+class BuildReport(object):
+    def __init__(self):
+        self.parallelism = 1
+
+        # Output -> (critical path length, duration, desc, predecessor) of the edge producing it.
+        self.produced = {}
+
+        # Edge id -> (critical path length of its inputs, predecessor, outputs) for running edges.
+        self.pending = {}
+
+        # Node of the edge with the longest critical path.
+        self.critical = None
+
+        self.running = 0
+        self.last_time = 0
+        self.running_area = 0 # integral of running jobs over time in milliseconds
+
+        self.total_starved = 0
+        self.starved_since = None
+        self.starved_min_running = 0
+        self.starved_periods = [] # min-heap of (duration, start, min running jobs)
+
+    def build_started(self, parallelism):
+        self.parallelism = max(parallelism, 1)
+
+    def update_running(self, time_millis, delta):
+        """Accounts for the time since the last change and changes the number of running jobs."""
+        elapsed = time_millis - self.last_time
+        if elapsed > 0:
+            self.running_area += self.running * elapsed
+            if self.running < self.parallelism:
+                if self.starved_since is None:
+                    self.starved_since = self.last_time
+                    self.starved_min_running = self.running
+                else:
+                    self.starved_min_running = min(self.starved_min_running, self.running)
+            elif self.starved_since is not None:
+                self.end_starved_period(self.last_time)
+            self.last_time = time_millis
+        self.running += delta
+
+    def end_starved_period(self, time_millis):
+        duration = time_millis - self.starved_since
+        self.total_starved += duration
+        period = (duration, self.starved_since, self.starved_min_running)
+        if len(self.starved_periods) < STARVED_PERIODS:
+            heapq.heappush(self.starved_periods, period)
+        else:
+            heapq.heappushpop(self.starved_periods, period)
+        self.starved_since = None
+
+    def edge_started(self, edge_started):
+        inputs_length = 0
+        predecessor = None
+        produced = self.produced
+        for path in edge_started.inputs:
+            node = produced.get(path)
+            if node is not None and node[0] > inputs_length:
+                inputs_length = node[0]
+                predecessor = node
+        self.pending[edge_started.id] = (inputs_length, predecessor, list(edge_started.outputs))
+        self.update_running(edge_started.start_time, 1)
+
+    def edge_finished(self, edge, edge_finished):
+        """edge only needs the start_time, desc and command of the EdgeStarted message."""
+        inputs_length, predecessor, outputs = self.pending.pop(edge_finished.id)
+        duration = edge_finished.end_time - edge.start_time
+        node = (inputs_length + duration, duration, edge.desc or edge.command, predecessor)
+        for path in outputs:
+            self.produced[path] = node
+        if self.critical is None or node[0] > self.critical[0]:
+            self.critical = node
+        self.update_running(edge_finished.end_time, -1)
+
+    def lines(self, time_millis):
+        """Returns the report for a build which took time_millis."""
+        self.update_running(time_millis, 0)
+        if self.starved_since is not None:
+            self.end_starved_period(time_millis)
+
+        lines = []
+        if self.critical is not None:
+            path = []
+            node = self.critical
+            while node is not None:
+                path.append(node)
+                node = node[3]
+            lines.append('critical path: {} ({:.0f}% of the build) through {} job{}:'.format(
+                format_millis(self.critical[0]),
+                100 * self.critical[0] / time_millis if time_millis > 0 else 100,
+                len(path), 's' if len(path) != 1 else ''))
+            for node in reversed(path):
+                lines.append('  {:>9}  {}'.format(format_millis(node[1]), node[2]))
+
+        if time_millis > 0:
+            average = self.running_area / time_millis
+            lines.append('parallelism: {:.1f} of {} jobs on average ({:.0f}%)'.format(
+                average, self.parallelism, 100 * average / self.parallelism))
+        if self.starved_periods:
+            lines.append('fewer than {} jobs running for {}, longest periods:'.format(
+                self.parallelism, format_millis(self.total_starved)))
+            for duration, start, min_running in sorted(self.starved_periods, reverse=True):
+                lines.append('  {:>9}  at {}, down to {} job{}'.format(
+                    format_millis(duration), format_millis(start), min_running,
+                    's' if min_running != 1 else ''))
+        return lines
@@ -0,0 +1,184 @@
+"""Per-user ja server which keeps ja's modules imported, so that builds start without paying for
+the interpreter startup, imports and parsing the Status descriptor again.
+
+Start it with `python -m ja.server`. Every request of a client (see ja/client.py) is handled by a
+forked process, which waits for another forked process running the command line interface with
+the client's terminal, working directory and environment and reports its exit code. When ja's
+code changes, the server refuses requests and exits, so that clients fall back to running
+in-process until it's started again. Requests of clients with other code (e.g. another
+installation of ja) are refused as well.
+"""
+
+import array
+import os
+import signal
+import socket
+import struct
+import sys
+
+from ja.client import PROTOCOL, code_version, is_private_dir, socket_path
+
+def receive_request(conn):
+    """Returns the fields of the request and the file descriptors sent with it."""
+    fds = array.array('i')
+    data, ancdata, flags, address = conn.recvmsg(1, socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+    chunks = [data]
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks).split(b'\0'), list(fds)
+
+def run_cli(fields, fds):
+    """Runs ja's command line interface like ja would have in the client. Never returns."""
+    exit_code = 1
+    try:
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        for fd in fds:
+            if fd > 2:
+                os.close(fd)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        os.chdir(os.fsdecode(fields[2]))
+        argc = int(fields[3])
+        argv = [os.fsdecode(arg) for arg in fields[4:4 + argc]]
+        os.environ.clear()
+        for entry in fields[4 + argc:]:
+            key, _, value = os.fsdecode(entry).partition('=')
+            os.environ[key] = value
+        sys.stdin = os.fdopen(0, 'r', closefd=False)
+        sys.stdout = os.fdopen(1, 'w', 1, encoding='utf-8', closefd=False)
+        sys.stderr = os.fdopen(2, 'w', 1, encoding='utf-8', errors='backslashreplace',
+                               closefd=False)
+
+        import time
+        from ja import cli
+        from ja.log import StartupProfile
+        cli.profile = StartupProfile(time.perf_counter())
+        try:
+            cli.main(argv, prog_name='ja')
+            exit_code = 0
+        except SystemExit as err:
+            if err.code is None:
+                exit_code = 0
+            elif isinstance(err.code, int):
+                exit_code = err.code
+            else:
+                sys.stderr.write('{}\n'.format(err.code))
+        except KeyboardInterrupt:
+            exit_code = 130
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            import atexit
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+def handle(conn, version):
+    """Runs a request in a forked process and sends its PID and exit code to the client. Closes
+    the connection without a reply if the client's code isn't version, so that it builds
+    in-process."""
+    fields, fds = receive_request(conn)
+    try:
+        if len(fields) < 4 or fields[0] != PROTOCOL or fields[1] != version or len(fds) != 3:
+            return
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            run_cli(fields, fds)
+    finally:
+        for fd in fds:
+            os.close(fd)
+    conn.sendall('pid {}\n'.format(pid).encode())
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        exit_code = 128 + os.WTERMSIG(status)
+    else:
+        exit_code = os.WEXITSTATUS(status)
+    conn.sendall('exit {}\n'.format(exit_code).encode())
+
+def serve(path=None):
+    path = path or socket_path()
+
+    # Everything a build could need, so that forked processes don't have to import it:
+    from ja import cli, frontend, native, history, lock, trace, report, capabilities, memory, \
+        compiler_cache, attach
+    frontend.status_class()
+    import humanize
+
+    version = code_version()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        print('ja server already running on {}'.format(path))
+        sys.exit(1)
+    except OSError:
+        pass
+    directory = os.path.dirname(path)
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    if not is_private_dir(directory):
+        print('{} has to be a directory which only you can access'.format(directory))
+        sys.exit(1)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    old_umask = os.umask(0o077) # only this user may connect
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    sock.listen(16)
+    print('ja server listening on {}'.format(path))
+    sys.stdout.flush()
+
+    # Request handlers report the exit codes themselves, don't leave zombies behind:
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            conn, _ = sock.accept()
+            try:
+                creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                        struct.calcsize('3i'))
+                if struct.unpack('3i', creds)[1] != os.getuid():
+                    continue
+                if code_version() != version:
+                    print('ja has been updated, exiting')
+                    return
+                if os.fork() == 0:
+                    exit_code = 1
+                    try:
+                        sock.close()
+                        # Not in the process group of the server, e.g. for its Ctrl+C:
+                        os.setpgid(0, 0)
+                        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                        signal.signal(signal.SIGINT, signal.SIG_IGN)
+                        handle(conn, version)
+                        exit_code = 0
+                    finally:
+                        os._exit(exit_code)
+            finally:
+                conn.close()
+    finally:
+        sock.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,155 @@
+"""Maps source files to the targets which compile them, so that `ja path/to/file.cpp` only
+compiles that file.
+
+The index is built from compile_commands.json, which CMake and Meson write into the build
+directory, and cached in the build directory until compile_commands.json changes. The object file
+of an entry is its "output" or the argument of -o in its command. Entries without either are
+mapped to ninja's "file^" syntax, which stands for the first output of the edge that has the file
+as input.
+
+CMake's Ninja Multi-Config generator lists every source once per configuration, so the index is
+keyed by configuration as well. Only the objects of the configuration of the build file which is
+used are built.
+"""
+
+import marshal
+import os
+import re
+
+from ja.store import write_atomically
+
+COMPILE_COMMANDS = 'compile_commands.json'
+INDEX_FILE = '.ja_sources'
+
+# Bumped when the format of INDEX_FILE changes.
+INDEX_VERSION = 2
+
+# build.ninja and build-<config>.ninja of Ninja Multi-Config include the rules of their
+# configuration near the top:
+IMPL_INCLUDE_RE = re.compile(r'include CMakeFiles/impl-(.+)\.ninja$')
+# Multi-config objects are placed in CMakeFiles/<target>.dir/<config>/:
+CONFIG_DIR_RE = re.compile(r'(?:^|/)CMakeFiles/[^/]+\.dir/([^/]+)/')
+
+def file_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def entry_arguments(entry):
+    if 'arguments' in entry:
+        return entry['arguments']
+    import shlex
+    return shlex.split(entry.get('command', ''))
+
+def entry_output(entry, arguments):
+    """Returns the object file an entry of compile_commands.json compiles to, None if unknown."""
+    if 'output' in entry:
+        return entry['output']
+    for i, arg in enumerate(arguments):
+        if arg == '-o' and i + 1 < len(arguments):
+            return arguments[i + 1]
+        if arg.startswith('/Fo') and len(arg) > 3: # MSVC
+            return arg[3:]
+    return None
+
+def entry_config(arguments, output, build_dir):
+    """Returns the configuration of Ninja Multi-Config an entry belongs to, '' for none."""
+    for arg in arguments:
+        # CMake defines this for every multi-config generator:
+        if arg.startswith('-DCMAKE_INTDIR='):
+            return arg[len('-DCMAKE_INTDIR='):].strip('\\"')
+    if output is not None:
+        match = CONFIG_DIR_RE.search(output.replace('\\', '/'))
+        if match and os.path.exists(os.path.join(build_dir,
+                                                 'build-{}.ninja'.format(match.group(1)))):
+            return match.group(1)
+    return ''
+
+def build_index(build_dir):
+    """Returns a dict of real paths of source files -> dict of configuration ('' if unknown) ->
+    list of ninja targets."""
+    import json
+    with open(COMPILE_COMMANDS, 'rb') as f:
+        entries = json.load(f)
+    index = {}
+    for entry in entries:
+        directory = entry.get('directory', build_dir)
+        path = os.path.join(directory, entry['file'])
+        arguments = entry_arguments(entry)
+        output = entry_output(entry, arguments)
+        config = entry_config(arguments, output, build_dir)
+        if output is not None:
+            output = os.path.join(directory, output)
+            target = os.path.relpath(output, build_dir) if os.path.isabs(output) else output
+        else:
+            target = entry['file'] + '^' # as build.ninja names it
+        targets = index.setdefault(os.path.realpath(path), {}).setdefault(config, [])
+        if target not in targets:
+            targets.append(target)
+    return index
+
+def load_index():
+    """Returns the cached index of the build directory, rebuilds it if necessary. Returns an
+    empty dict if there's no compile_commands.json.
+    """
+    key = (INDEX_VERSION, file_key(COMPILE_COMMANDS))
+    if key[1] is None:
+        return {}
+    try:
+        with open(INDEX_FILE, 'rb') as f:
+            cached_key, index = marshal.load(f)
+        if cached_key == key:
+            return index
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    try:
+        index = build_index(os.getcwd())
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    write_atomically(INDEX_FILE, lambda f: marshal.dump((key, index), f))
+    return index
+
+def build_file_config(build_file):
+    """Returns the configuration build_file of Ninja Multi-Config builds, None if it isn't one."""
+    try:
+        with open(build_file, encoding='utf-8', errors='replace') as f:
+            for _, line in zip(range(32), f):
+                match = IMPL_INCLUDE_RE.match(line.rstrip())
+                if match:
+                    return match.group(1)
+    except OSError:
+        pass
+    return None
+
+def select_targets(targets_by_config, config):
+    """Returns the targets of config, or those of every configuration if config isn't known."""
+    if config in targets_by_config:
+        return targets_by_config[config]
+    selected = []
+    for targets in targets_by_config.values():
+        for target in targets:
+            if target not in selected:
+                selected.append(target)
+    return selected
+
+def map_sources(targets, source_paths, build_file):
+    """Replaces targets which are source files by the targets compiling them with build_file.
+
+    source_paths maps targets to real paths of the files they name, for targets which are
+    existing files relative to the directory ja was started in.
+    """
+    if not source_paths:
+        return targets
+    index = load_index()
+    config = build_file_config(build_file)
+    mapped = []
+    for target in targets:
+        outputs = select_targets(index.get(source_paths.get(target), {}), config)
+        if outputs:
+            mapped.extend(outputs)
+        else:
+            mapped.append(target)
+    return tuple(mapped)
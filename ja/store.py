@@ -0,0 +1,25 @@
+"""Writing the files ja keeps in the build directory and in its cache directory."""
+
+import os
+import sys
+
+# Byte order of the arrays in binary files, which are written and read with array.tofile and
+# array.fromfile.
+BYTE_ORDER = b'l' if sys.byteorder == 'little' else b'b'
+
+def write_atomically(path, write, mode='wb', **kwargs):
+    """Calls write with a temporary file opened with mode and kwargs, which then replaces path,
+    so that concurrent readers never see a partially written file. Returns False if writing
+    failed."""
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            write(f)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
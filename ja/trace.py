@@ -0,0 +1,59 @@
+"""Streams the edges of a build into a Chrome trace event file.
+
+The file can be opened in chrome://tracing or https://ui.perfetto.dev. Every edge is written as a
+complete event as soon as it finishes, so only running edges are kept in memory. Edges are put on
+one track per concurrency slot: an edge gets the lowest slot which isn't used by a running edge.
+"""
+
+import heapq
+import json
+
+class TraceWriter(object):
+    def __init__(self, out):
+        self.out = out
+        self.running = {} # edge id -> (slot, outputs)
+        self.free_slots = [] # heap of slots which have been used before and are free again
+        self.slot_count = 0
+        self.separator = '[\n'
+        self.write_event({'name': 'process_name', 'ph': 'M', 'pid': 0,
+                          'args': {'name': 'ninja'}})
+
+    def write_event(self, event):
+        self.out.write(self.separator)
+        self.out.write(json.dumps(event, separators=(',', ':')))
+        self.separator = ',\n'
+
+    def edge_started(self, edge_started):
+        if self.free_slots:
+            slot = heapq.heappop(self.free_slots)
+        else:
+            slot = self.slot_count
+            self.slot_count += 1
+            self.write_event({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': slot,
+                              'args': {'name': 'slot {}'.format(slot)}})
+        self.running[edge_started.id] = (slot, list(edge_started.outputs))
+
+    def edge_finished(self, edge, edge_finished):
+        """edge only needs the id, start_time, desc and command of the EdgeStarted message."""
+        slot, outputs = self.running.pop(edge_finished.id)
+        heapq.heappush(self.free_slots, slot)
+        self.write_event({
+            'name': edge.desc or edge.command,
+            'cat': 'edge',
+            'ph': 'X',
+            'ts': edge.start_time * 1000,
+            'dur': (edge_finished.end_time - edge.start_time) * 1000,
+            'pid': 0,
+            'tid': slot,
+            'args': {
+                'outputs': outputs,
+                'command': edge.command,
+                'status': edge_finished.status,
+            },
+        })
+
+    def close(self):
+        if self.out.closed:
+            return
+        self.out.write('\n]\n')
+        self.out.close()
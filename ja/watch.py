@@ -0,0 +1,249 @@
+"""Rebuilding whenever a source file changes (`ja --watch`).
+
+Only the files the targets depend on are watched: the inputs ninja knows about (`ninja -t
+inputs`) and the headers found by the compilers (`ninja -t deps`). inotify watches their
+directories rather than the files themselves, because editors often save by renaming a new
+file over the old one. Files in the build directory are never watched, the build writes them.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import time
+
+from ja import ninja
+
+# Seconds without further changes before a build is started, so that saving several files at
+# once (or a checkout) starts one build instead of many.
+DEBOUNCE_SECONDS = 0.2
+
+# From <sys/inotify.h>:
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_ATTRIB | \
+             IN_ONLYDIR
+
+# wd, mask, cookie, length of the name which follows
+EVENT = struct.Struct('iIII')
+
+class Inotify(object):
+    """Watches directories for changes of a set of files in them.
+
+    Raises OSError if inotify isn't available (it's Linux only).
+    """
+    def __init__(self):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            inotify_init1 = self.libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available on this system')
+        self.fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.raise_errno()
+        self.directories = {} # wd -> directory
+        self.watches = {} # directory -> wd
+        self.files = {} # directory -> set of file names
+
+    def raise_errno(self, path=None):
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), path)
+
+    def fileno(self):
+        return self.fd
+
+    def watch(self, paths):
+        """Watches exactly the files in paths from now on."""
+        files = {}
+        for path in paths:
+            directory, name = os.path.split(path)
+            files.setdefault(directory, set()).add(name)
+        for directory in list(self.watches):
+            if directory not in files:
+                self.libc.inotify_rm_watch(self.fd, self.watches.pop(directory))
+        for directory in files:
+            if directory in self.watches:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                if ctypes.get_errno() in (2, 20): # ENOENT, ENOTDIR: removed in the meantime
+                    continue
+                self.raise_errno(directory)
+            self.watches[directory] = wd
+            self.directories[wd] = directory
+        self.files = files
+
+    def read_changes(self):
+        """Returns the watched files which changed since the last call, without blocking."""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            pos = 0
+            while pos + EVENT.size <= len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, pos)
+                name = data[pos + EVENT.size:pos + EVENT.size + length].rstrip(b'\0')
+                pos += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add('') # events were lost, something might have changed
+                    continue
+                directory = self.directories.get(wd)
+                name = os.fsdecode(name)
+                if directory is not None and name in self.files.get(directory, ()):
+                    changed.add(os.path.join(directory, name))
+
+    def wait_for_changes(self, timeout=None):
+        """Blocks until watched files changed and no further changes followed for
+        DEBOUNCE_SECONDS, returns them. Returns an empty set after timeout seconds.
+        """
+        changed = set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if changed:
+                wait = DEBOUNCE_SECONDS
+            elif deadline is None:
+                wait = None
+            else:
+                wait = max(deadline - time.monotonic(), 0)
+            if not select.select([self.fd], [], [], wait)[0]:
+                return changed
+            changed |= self.read_changes()
+
+    def close(self):
+        os.close(self.fd)
+
+def ninja_paths(f, tool, targets=()):
+    """Runs `ninja -t tool` and returns the lines it printed, stripped. Returns an empty list
+    if the tool failed, e.g. because this ninja doesn't know it.
+    """
+    proc = subprocess.run(['ninja', '-f', f, '-t', tool] + list(targets),
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if proc.returncode != 0:
+        return []
+    return [line.strip() for line in proc.stdout.decode('utf-8', 'replace').splitlines()]
+
+def watched_files(f, targets):
+    """Returns the real paths of the source files which the targets depend on."""
+    paths = ninja_paths(f, 'inputs', targets)
+    if not paths:
+        # ninja < 1.12 doesn't have `-t inputs`, fall back to what has been compiled:
+        from ja.sources import load_index
+        paths = list(load_index(f))
+    # The headers, in indented lines below each output:
+    paths += [line for line in ninja_paths(f, 'deps') if line and not line.endswith(')')]
+    # CMakeLists.txt, meson.build etc. which regenerate the build file:
+    paths += ninja_paths(f, 'inputs', [f])
+
+    build_dir = os.path.realpath('.') + os.sep
+    files = set()
+    for path in paths:
+        path = os.path.realpath(path)
+        if not path.startswith(build_dir) and os.path.exists(path):
+            files.add(path)
+    return files
+
+class Watch(object):
+    """Builds targets over and over, starting a new build as soon as source files change."""
+
+    def __init__(self, native, f, targets, start_ninja, open_status_stream, lock=None):
+        self.native = native
+        self.f = f
+        self.targets = targets
+        # start_ninja() returns a Popen of ninja in its own process group,
+        # open_status_stream(idle) the Frontend reading its status stream:
+        self.start_ninja = start_ninja
+        self.open_status_stream = open_status_stream
+        # BuildDirectoryLock which records the PID of ninja:
+        self.lock = lock
+        self.inotify = Inotify()
+        self.ninja = None
+        self.changed = set()
+
+    def run(self):
+        """Never returns, raises KeyboardInterrupt when the user stops it."""
+        native = self.native
+        printer = native.printer
+        try:
+            while True:
+                files = watched_files(self.f, self.targets)
+                self.inotify.watch(files)
+                # Changes which happened during the build were read already or are still queued:
+                self.changed = set()
+                self.build()
+                native.trace = None # only the first build is traced
+                if self.changed:
+                    # The build has been cancelled, wait until the burst of changes is over:
+                    self.changed |= self.inotify.wait_for_changes(DEBOUNCE_SECONDS)
+                else:
+                    printer.print_line('\x1b[1;36mwatching {} file{} for changes, press Ctrl+C to '
+                                       'stop\x1b[0m'.format(len(files), 's' if len(files) != 1 else ''),
+                                       printer.LINE_FULL)
+                    self.changed = self.inotify.wait_for_changes()
+                self.print_changes()
+        finally:
+            if self.ninja is not None and self.ninja.poll() is None:
+                self.cancel()
+            self.inotify.close()
+
+    def build(self):
+        native = self.native
+        self.ninja = self.start_ninja()
+        native.interrupt_fd = self.inotify.fileno()
+        status_stream = self.open_status_stream(self.idle)
+        finished = False
+        try:
+            for msg in status_stream:
+                native.handle(msg)
+                finished = finished or msg.HasField('build_finished')
+        except Exception:
+            if not self.changed:
+                raise
+            # The stream might end within a message when the build has been cancelled
+        finally:
+            native.interrupt_fd = None
+            status_stream.reader.close()
+        if not finished:
+            # Failed or cancelled, keep what we've seen of it (build_finished does this otherwise):
+            native.build_stopped()
+        self.ninja.wait()
+        if self.lock is not None:
+            self.lock.set_ninja_pids([])
+
+    def idle(self, reader):
+        """Waits for the next message, cancels the build if sources change in the meantime."""
+        native = self.native
+        native.wait_for_input(reader)
+        if native.interrupt_fd is None:
+            return
+        self.changed = self.inotify.read_changes()
+        if self.changed:
+            native.interrupt_fd = None
+            self.cancel()
+
+    def cancel(self):
+        ninja.cancel(self.ninja.pid) # the status stream ends when ninja has exited
+
+    def print_changes(self):
+        printer = self.native.printer
+        changed = sorted(path for path in self.changed if path)
+        if not changed:
+            description = 'files changed'
+        elif len(changed) == 1:
+            description = '{} changed'.format(os.path.relpath(changed[0]))
+        else:
+            description = '{} and {} more changed'.format(os.path.relpath(changed[0]),
+                                                          len(changed) - 1)
+        printer.print_on_new_line('\x1b[1;36m{}, rebuilding\x1b[0m\n'.format(description))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""Feeds status streams through Frontend and NinjaNativeFrontend as fast as possible, to measure
+the overhead of ja itself. Streams are either recorded with `ja --record FILE` or synthetic.
+"""
+
+import collections
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import traceback
+
+import click
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from bench import synthetic_messages
+from ja import frontend
+from ja.native import NinjaNativeFrontend
+
+MESSAGE_TYPES = ('edge_started', 'edge_finished', 'total_edges', 'build_started', 'build_finished',
+                 'message')
+
+def write_synthetic(path, edges, output_size, output_every):
+	with open(path, 'wb') as f:
+		for data in synthetic_messages(frontend.status_class(), edges, output_size=output_size,
+		                               output_every=output_every):
+			f.write(data)
+
+def create_frontend(smart_terminal, refresh_rate):
+	native = NinjaNativeFrontend(refresh_rate)
+	native.printer.smart_terminal = smart_terminal
+	native.printer.width = 120
+	return native
+
+def replay(path, smart_terminal, refresh_rate):
+	"""Returns the number of messages, the total time and (count, seconds) per message type.
+	Decoding is accounted to the type 'decoding'.
+	"""
+	native = create_frontend(smart_terminal, refresh_rate)
+	handlers = collections.defaultdict(lambda: [0, 0.0])
+	perf_counter = time.perf_counter
+	with open(path, 'rb', 0) as f:
+		stream = frontend.Frontend(f)
+		decoding = handlers['decoding']
+		start = perf_counter()
+		while True:
+			before_decoding = perf_counter()
+			try:
+				msg = next(stream)
+			except StopIteration:
+				break
+			before_handling = perf_counter()
+			native.handle(msg)
+			after_handling = perf_counter()
+			decoding[0] += 1
+			decoding[1] += before_handling - before_decoding
+			handler = handlers[next(name for name in MESSAGE_TYPES if msg.HasField(name))]
+			handler[0] += 1
+			handler[1] += after_handling - before_handling
+		elapsed = perf_counter() - start
+	return decoding[0], elapsed, dict(handlers)
+
+def replay_in_child(path, smart_terminal, refresh_rate):
+	"""Runs replay in a forked process and additionally returns by how much it raised the peak
+	RSS in bytes. The child starts with the RSS of this process, so the replays don't influence
+	each other's peak and measuring doesn't slow down replaying (unlike tracemalloc).
+	"""
+	read_fd, write_fd = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close(read_fd)
+		try:
+			# Everything NinjaNativeFrontend prints goes to /dev/null, the terminal is only emulated:
+			sys.stdout = open(os.devnull, 'w')
+			rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			count, elapsed, handlers = replay(path, smart_terminal, refresh_rate)
+			peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+			with os.fdopen(write_fd, 'w') as f:
+				json.dump([count, elapsed, handlers, peak], f)
+		except BaseException:
+			traceback.print_exc()
+		finally:
+			os._exit(0)
+	os.close(write_fd)
+	with os.fdopen(read_fd) as f:
+		data = f.read()
+	os.waitpid(pid, 0)
+	if not data:
+		raise RuntimeError('replaying {} failed'.format(path))
+	return json.loads(data)
+
+def report(name, path, terminals, refresh_rate):
+	for smart_terminal in terminals:
+		count, elapsed, handlers, peak = replay_in_child(path, smart_terminal, refresh_rate)
+		print('{}, {} terminal: {} messages in {:.3f}s, {:.0f} messages/s, peak RSS +{:.1f} MB'.format(
+			name, 'smart' if smart_terminal else 'dumb', count, elapsed, count / elapsed, peak / 1e6))
+		for handler, (handled, seconds) in sorted(handlers.items(), key=lambda item: -item[1][1]):
+			print('  {:<15} {:>9} messages {:8.3f}s {:8.2f} µs/message'.format(
+				handler, handled, seconds, seconds / handled * 1e6))
+
+@click.command(help="""Replays RECORDINGS made with `ja --record FILE` and reports messages/s,
+the time spent per message type and the peak memory (Unix only). Without RECORDINGS synthetic
+builds are replayed.""")
+@click.option('--edges', metavar='N', type=int, multiple=True,
+              help='Number of edges of a synthetic build, can be repeated. '
+                   '[default=10000, 100000, 1000000]')
+@click.option('--output-size', metavar='BYTES', type=int, default=4096, show_default=True,
+              help='Size of the output of the synthetic edges which print warnings.')
+@click.option('--output-every', metavar='N', type=int, default=100, show_default=True,
+              help='Every N-th synthetic edge prints warnings.')
+@click.option('--terminal', type=click.Choice(['smart', 'dumb', 'both']), default='both',
+              show_default=True)
+@click.option('--refresh-rate', metavar='HZ', type=float,
+              help="Same as ja's --refresh-rate. [default=30]")
+@click.argument('recordings', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def main(edges, output_size, output_every, terminal, refresh_rate, recordings):
+	terminals = {'smart': (True,), 'dumb': (False,), 'both': (True, False)}[terminal]
+	for path in recordings:
+		report(path, path, terminals, refresh_rate)
+	if recordings and not edges:
+		return
+	with tempfile.TemporaryDirectory() as tdir:
+		for count in edges or (10000, 100000, 1000000):
+			path = os.path.join(tdir, '{}.status'.format(count))
+			write_synthetic(path, count, output_size, output_every)
+			report('{} edges'.format(count), path, terminals, refresh_rate)
+			os.remove(path)
+
+if __name__ == '__main__':
+	main()
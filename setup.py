@@ -1,6 +1,6 @@
 from setuptools import setup
 
-VERSION='1.1.3' # also see __init__.py
+VERSION='1.1.3' # also see ja/cli.py
 
 setup(
     name='ja',
@@ -20,4 +20,7 @@ setup(
         'click',
         'protobuf',
     ],
+    extras_require={
+        'test': ['pytest'],
+    },
 )
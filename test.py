@@ -25,11 +25,11 @@ with tempfile.TemporaryDirectory() as tdir:
 	with open('main.c', 'w') as f:
 		f.write('error')
 	run(JA, True)
-	assert not os.path.exists('build/ja.lock')
+	assert not os.path.exists('build/ja.fifo')
 	run(JA + ' -t clean')
-	assert not os.path.exists('build/ja.lock')
+	assert not os.path.exists('build/ja.fifo')
 	run(JA + ' -t doesnt_exist', True)
-	assert not os.path.exists('build/ja.lock')
+	assert not os.path.exists('build/ja.fifo')
 	with open('main.c', 'w') as f:
 		f.write("int main() {}")
 	run(JA)
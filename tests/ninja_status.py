@@ -0,0 +1,76 @@
+"""Status messages of ninja and stand-ins for a ninja process, shared by the tests."""
+
+import io
+
+from ja import frontend
+
+def total_edges(count):
+    msg = frontend.status_class()()
+    msg.total_edges.total_edges = count
+    return msg
+
+def build_started(parallelism):
+    msg = frontend.status_class()()
+    msg.build_started.parallelism = parallelism
+    return msg
+
+def build_finished():
+    msg = frontend.status_class()()
+    msg.build_finished.SetInParent()
+    return msg
+
+def edge_started(edge_id, start_time):
+    msg = frontend.status_class()()
+    msg.edge_started.id = edge_id
+    msg.edge_started.start_time = start_time
+    msg.edge_started.desc = 'Building {}.o'.format(edge_id)
+    msg.edge_started.command = 'cc -c {}.c'.format(edge_id)
+    msg.edge_started.outputs.append('{}.o'.format(edge_id))
+    return msg
+
+def edge_finished(edge_id, end_time, status=0, output=''):
+    msg = frontend.status_class()()
+    msg.edge_finished.id = edge_id
+    msg.edge_finished.end_time = end_time
+    msg.edge_finished.status = status
+    msg.edge_finished.output = output
+    return msg
+
+def two_edges(fail, finished=True):
+    """Messages of a build running two edges in parallel, of which the first fails if fail."""
+    messages = [total_edges(2), build_started(2), edge_started(0, 0), edge_started(1, 0),
+                edge_finished(0, 10, 1 if fail else 0, 'error: expected\n' if fail else ''),
+                edge_finished(1, 20)]
+    if finished:
+        messages.append(build_finished())
+    return messages
+
+def encode(messages):
+    """The length-delimited stream ninja writes to its frontend."""
+    stream = bytearray()
+    for msg in messages:
+        data = msg.SerializeToString()
+        size = len(data)
+        while size > 0x7f:
+            stream.append((size & 0x7f) | 0x80)
+            size >>= 7
+        stream.append(size)
+        stream += data
+    return bytes(stream)
+
+class TraceOutput(io.StringIO):
+    """Keeps what has been written after close()."""
+
+    def close(self):
+        self.final_value = self.getvalue()
+        super().close()
+
+class FinishedNinja(object):
+    """Popen of a ninja which has exited."""
+
+    def __init__(self, returncode=0):
+        self.pid = 0
+        self.returncode = returncode
+
+    def wait(self):
+        return self.returncode
@@ -0,0 +1,52 @@
+import json
+import os
+
+from ja import frontend
+from ja.configs import MultiConfigBuild, parse_configs, split_jobs
+from ja.native import NinjaNativeFrontend
+from ja.trace import TraceWriter
+
+from ninja_status import FinishedNinja, TraceOutput, encode, two_edges
+
+def pipe_reader(data):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, data)
+    os.close(write_fd)
+    return os.fdopen(read_fd, 'rb', 0)
+
+def run_builds(native, failing):
+    """Runs a Debug and a Release build of two edges each, returns the failed configurations."""
+    multi_config = MultiConfigBuild(native, ['Debug', 'Release'])
+    for build in multi_config.builds:
+        fail = build.config in failing
+        build.stream = frontend.Frontend(pipe_reader(encode(two_edges(fail))))
+        build.ninja = FinishedNinja(1 if fail else 0)
+    return multi_config.run()
+
+def test_failure_in_one_configuration_lets_the_others_finish():
+    out = TraceOutput()
+    native = NinjaNativeFrontend(trace=TraceWriter(out))
+    assert run_builds(native, ['Debug']) == ['Debug']
+    assert native.finished_edges == 4
+    # The failure didn't end the trace of the other configuration:
+    events = json.loads(out.final_value)
+    assert 'Release: Building 1.o' in [event['name'] for event in events if event['ph'] == 'X']
+
+def test_configurations_are_merged():
+    out = TraceOutput()
+    native = NinjaNativeFrontend(trace=TraceWriter(out))
+    assert run_builds(native, []) == []
+    assert out.closed # by the build_finished of the last configuration
+    assert native.total_edges == 4
+    assert native.finished_edges == 4
+    events = json.loads(out.final_value)
+    assert sorted(event['name'] for event in events if event['ph'] == 'X') == [
+        'Debug: Building 0.o', 'Debug: Building 1.o',
+        'Release: Building 0.o', 'Release: Building 1.o']
+
+def test_parse_configs():
+    assert parse_configs('Debug, Release,,Debug') == ['Debug', 'Release']
+
+def test_split_jobs():
+    assert split_jobs(7, 2) == [4, 3]
+    assert split_jobs(1, 3) == [1, 1, 1]
@@ -0,0 +1,120 @@
+import io
+import random
+
+from ja import frontend
+from ja.frontend import decode_selectively
+
+from ninja_status import encode
+
+# Including multi-byte UTF-8:
+CHARACTERS = 'abc /.-_0123456789äöü漢字\n\t"\\'
+
+def random_text(rng, max_length=40):
+    return ''.join(rng.choice(CHARACTERS) for _ in range(rng.randrange(0, max_length)))
+
+def random_varint_value(rng):
+    return rng.choice([0, 1, 127, 128, 300, 1 << 20, (1 << 32) - 1, rng.randrange(1 << 32)])
+
+def random_message(rng):
+    msg = frontend.status_class()()
+    if rng.random() < 0.5:
+        edge = msg.edge_started
+        edge.SetInParent() # stays set if every field is the default
+        if rng.random() < 0.8:
+            edge.id = random_varint_value(rng)
+        if rng.random() < 0.8:
+            edge.start_time = random_varint_value(rng)
+        for _ in range(rng.randrange(0, 5)):
+            edge.inputs.append(random_text(rng))
+        for _ in range(rng.randrange(0, 3)):
+            edge.outputs.append(random_text(rng))
+        if rng.random() < 0.8:
+            edge.desc = random_text(rng)
+        if rng.random() < 0.8:
+            edge.command = random_text(rng, 200)
+        edge.console = rng.random() < 0.2
+    else:
+        edge = msg.edge_finished
+        edge.SetInParent()
+        if rng.random() < 0.8:
+            edge.id = random_varint_value(rng)
+        if rng.random() < 0.8:
+            edge.end_time = random_varint_value(rng)
+        edge.status = rng.choice([0, 0, 1, -1, 2, -2, 127, -128, (1 << 31) - 1, -(1 << 31)])
+        if rng.random() < 0.5:
+            edge.output = random_text(rng, 300)
+    return msg
+
+def assert_same(lazy, msg):
+    if msg.HasField('edge_started'):
+        assert lazy.HasField('edge_started') and not lazy.HasField('edge_finished')
+        expected = msg.edge_started
+        edge = lazy.edge_started
+        assert edge.id == expected.id
+        assert edge.start_time == expected.start_time
+        assert list(edge.outputs) == list(expected.outputs)
+        assert edge.desc == expected.desc
+        assert edge.command == expected.command
+        assert edge.console == expected.console
+        assert list(edge.inputs) == list(expected.inputs)
+    else:
+        assert lazy.HasField('edge_finished') and not lazy.HasField('edge_started')
+        expected = msg.edge_finished
+        edge = lazy.edge_finished
+        assert edge.id == expected.id
+        assert edge.end_time == expected.end_time
+        assert edge.status == expected.status
+        assert edge.output == expected.output
+
+def test_decode_selectively_matches_protobuf():
+    rng = random.Random(1234)
+    status_class = frontend.status_class()
+    for _ in range(5000):
+        msg = random_message(rng)
+        data = msg.SerializeToString()
+        lazy = decode_selectively(data, 0, len(data))
+        assert lazy is not None, data
+        assert_same(lazy, status_class.FromString(data))
+
+def test_decode_selectively_within_buffer():
+    rng = random.Random(5678)
+    msg = random_message(rng)
+    data = msg.SerializeToString()
+    buf = bytearray(b'\xff' * 7 + data + b'\xff' * 3)
+    assert_same(decode_selectively(buf, 7, 7 + len(data)), msg)
+
+def test_decode_selectively_leaves_other_messages_to_protobuf():
+    status_class = frontend.status_class()
+    assert decode_selectively(b'', 0, 0) is None
+    for field in ('total_edges', 'build_started', 'build_finished', 'message'):
+        msg = status_class()
+        getattr(msg, field).SetInParent()
+        data = msg.SerializeToString()
+        assert decode_selectively(data, 0, len(data)) is None
+    # Two fields in one message:
+    msg = status_class()
+    msg.edge_finished.id = 1
+    msg.total_edges.total_edges = 3
+    data = msg.SerializeToString()
+    assert decode_selectively(data, 0, len(data)) is None
+
+def test_decode_selectively_rejects_truncated_messages():
+    rng = random.Random(91011)
+    for _ in range(500):
+        data = random_message(rng).SerializeToString()
+        for end in range(len(data)):
+            try:
+                assert decode_selectively(data[:end], 0, end) is None
+            except IndexError:
+                pass # Frontend leaves these to protobuf, which reports the error
+
+def test_frontend_decodes_stream_in_small_chunks():
+    rng = random.Random(1213)
+    messages = [random_message(rng) for _ in range(200)]
+    reader = io.BytesIO(encode(messages))
+    stream = frontend.Frontend(reader, chunk_size=7)
+    stream.selective = True # even where the protobuf runtime would be faster
+    decoded = list(stream)
+    assert len(decoded) == len(messages)
+    for lazy, msg in zip(decoded, messages):
+        assert_same(lazy, msg)
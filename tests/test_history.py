@@ -0,0 +1,33 @@
+from ja.history import DurationHistory, output_key
+
+def test_import_ninja_log_keys_every_output(tmp_path):
+    log = tmp_path / '.ninja_log'
+    log.write_text('# ninja log v5\n'
+                   '0\t100\t0\ta.o\t1234\n'
+                   '0\t300\t0\tlib.so.TOC\tabcd\n'
+                   '0\t300\t0\tlib.so\tabcd\n'
+                   '10\t160\t0\ta.o\t1234\n')
+    history = DurationHistory(str(tmp_path / '.ja_history'))
+    history.import_ninja_log(str(log))
+    assert history.durations[output_key('a.o')] == 150 # the newest line wins
+    assert history.durations[output_key('lib.so')] == 300
+    assert history.durations[output_key('lib.so.TOC')] == 300
+
+def test_save_and_load(tmp_path):
+    history = DurationHistory(str(tmp_path / '.ja_history'))
+    history.record(output_key('a.o'), 100)
+    history.record(output_key('a.o'), 140)
+    history.save()
+    loaded = DurationHistory(str(tmp_path / '.ja_history'))
+    loaded.load()
+    assert loaded.durations == history.durations
+    assert loaded.deviations == history.deviations
+    assert loaded.generations == history.generations
+
+def test_older_history_is_replaced_by_ninja_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.ninja_log').write_text('# ninja log v5\n0\t100\t0\ta.o\t1234\n')
+    (tmp_path / '.ja_history').write_bytes(b'jah1l\0\0\0\0\0\0\0\0\0\0\0')
+    history = DurationHistory()
+    history.load()
+    assert history.durations == {output_key('a.o'): 100}
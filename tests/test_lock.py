@@ -0,0 +1,80 @@
+import os
+import subprocess
+import threading
+import time
+
+from ja.lock import BuildDirectoryLock, parse_record, process_start_time
+
+def read_ticket(lock, ticket):
+    with open(lock.ticket_path(ticket), 'rb') as f:
+        return parse_record(f.read())
+
+def test_tickets_are_granted_in_order(tmp_path):
+    path = str(tmp_path / '.ja_lock')
+    first = BuildDirectoryLock(path)
+    first.acquire(lambda reason: None)
+    assert read_ticket(first, 1) == (os.getpid(), [])
+
+    reasons = []
+    second = BuildDirectoryLock(path)
+    thread = threading.Thread(target=second.acquire, args=(reasons.append,))
+    thread.start()
+    time.sleep(0.1)
+    assert thread.is_alive()
+    os.close(first.ticket_fd) # as if the first ja had exited
+    thread.join(5)
+    assert not thread.is_alive()
+    assert reasons == ['file lock on build directory (ja, pid {})'.format(os.getpid())]
+    assert not os.path.exists(first.ticket_path(1))
+    os.close(second.ticket_fd)
+
+def test_waits_for_ninja_left_running(tmp_path):
+    path = str(tmp_path / '.ja_lock')
+    first = BuildDirectoryLock(path)
+    first.acquire(lambda reason: None)
+    # One ninja per configuration:
+    ninjas = [subprocess.Popen(['sleep', '0.2']), subprocess.Popen(['sleep', '0.4'])]
+    first.set_ninja_pids([ninja.pid for ninja in ninjas])
+    assert read_ticket(first, 1) == (os.getpid(), [(ninja.pid, process_start_time(ninja.pid))
+                                                   for ninja in ninjas])
+    os.close(first.ticket_fd)
+
+    reasons = []
+    BuildDirectoryLock(path).acquire(reasons.append)
+    assert reasons == ['ninja still running in the background (pid {})'.format(ninja.pid)
+                       for ninja in ninjas]
+    for ninja in ninjas:
+        assert ninja.poll() is not None
+
+def test_ignores_exited_ninja(tmp_path):
+    path = str(tmp_path / '.ja_lock')
+    first = BuildDirectoryLock(path)
+    first.acquire(lambda reason: None)
+    first.set_ninja_pids([os.getpid()]) # running, but ninja has been reaped:
+    first.set_ninja_pids([])
+    os.close(first.ticket_fd)
+
+    reasons = []
+    BuildDirectoryLock(path).acquire(reasons.append)
+    assert reasons == []
+
+def test_ignores_reused_pid(tmp_path):
+    path = str(tmp_path / '.ja_lock')
+    with open(path + '.1', 'w') as f:
+        # A running process with the PID of ninja, which was started later than ninja:
+        f.write('1 {} {}\n'.format(os.getpid(), process_start_time(os.getpid()) - 1))
+
+    reasons = []
+    lock = BuildDirectoryLock(path)
+    lock.acquire(reasons.append)
+    assert reasons == []
+    assert not os.path.exists(path + '.1')
+    os.close(lock.ticket_fd)
+
+def test_parse_record():
+    assert parse_record(b'12 34 56\n') == (12, [(34, 56)])
+    assert parse_record(b'12 34 56 78 90\n') == (12, [(34, 56), (78, 90)])
+    assert parse_record(b'12 34\n') == (12, [(34, 0)]) # written by an older ja
+    assert parse_record(b'12\n') == (12, [])
+    assert parse_record(b'') == (0, [])
+    assert parse_record(b'garbage') == (0, [])
@@ -0,0 +1,11 @@
+from ja.log import format_millis
+
+def test_format_millis():
+    assert format_millis(1503) == '1.5s'
+    assert format_millis(125000) == '2m05s'
+    assert format_millis(3725000) == '1h02m'
+
+def test_format_millis_precise():
+    assert format_millis(1503, precise=True) == '1.503s'
+    assert format_millis(125000, precise=True) == '2m05s'
+    assert format_millis(3725000, precise=True) == '1h02m05s'
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import time
+
+from ja import memory
+from ja.history import output_key
+from ja.memory import MemoryHistory, MemorySampler, read_processes
+
+GB = 1 << 30
+
+def sampler(monkeypatch, peaks, available=8 * GB, default=4):
+    monkeypatch.setattr(memory, 'available_memory', lambda: available)
+    monkeypatch.setattr(memory, 'default_parallelism', lambda: default)
+    history = MemoryHistory()
+    for output, peak in peaks.items():
+        history.record(output_key(output), peak)
+    return MemorySampler(history)
+
+def fail():
+    raise AssertionError('dry run without need')
+
+def test_needs_enough_history(monkeypatch):
+    assert sampler(monkeypatch, {'a.o': 6 * GB}).choose_parallelism(fail) is None
+
+def test_runs_default_if_heaviest_fit(monkeypatch):
+    peaks = {'{}.o'.format(i): GB for i in range(10)}
+    assert sampler(monkeypatch, peaks).choose_parallelism(fail) is None
+
+def test_limits_by_heaviest_of_history(monkeypatch):
+    peaks = {'{}.o'.format(i): 3 * GB for i in range(10)}
+    memory_sampler = sampler(monkeypatch, peaks)
+    assert memory_sampler.choose_parallelism() == 2
+    assert memory_sampler.decision == (2, 4, 8 * GB, 3 * GB)
+
+def test_limits_by_heaviest_of_planned_edges(monkeypatch):
+    peaks = {'heavy{}.o'.format(i): 3 * GB for i in range(4)}
+    peaks.update({'light{}.o'.format(i): GB // 4 for i in range(4)})
+    memory_sampler = sampler(monkeypatch, peaks)
+    # Only light jobs and ones which haven't been seen yet:
+    assert memory_sampler.choose_parallelism(lambda: ['light0.o', 'light1.o', 'new.o']) is None
+    assert memory_sampler.decision is None
+    assert memory_sampler.choose_parallelism(
+        lambda: ['heavy0.o', 'heavy1.o', 'heavy2.o', 'light0.o']) == 2
+    assert memory_sampler.decision == (2, 4, 8 * GB, 3 * GB)
+    # The dry run failed:
+    assert memory_sampler.choose_parallelism(lambda: None) == 2
+
+def test_at_least_one_job(monkeypatch):
+    peaks = {'{}.o'.format(i): 12 * GB for i in range(10)}
+    assert sampler(monkeypatch, peaks).choose_parallelism() == 1
+
+def test_read_processes_of_descendants():
+    child = subprocess.Popen(['sh', '-c', 'sleep 5; true'])
+    try:
+        time.sleep(0.2) # until sh has started sleep
+        processes = read_processes([os.getpid()])
+        assert processes[child.pid][0] == os.getpid()
+        assert processes[child.pid][1] > 0
+        grandchildren = [pid for pid, (parent, _) in processes.items() if parent == child.pid]
+        assert len(grandchildren) == 1 # sleep
+        assert os.getppid() not in processes
+    finally:
+        child.kill()
+        child.wait()
@@ -0,0 +1,89 @@
+import json
+import random
+
+from ja.native import NinjaNativeFrontend, ansi_escape_split_re, elide_middle, text_width
+from ja.trace import TraceWriter
+
+from ninja_status import TraceOutput, build_started, edge_finished, edge_started, total_edges
+
+# Pieces of random status lines: ASCII, wide (CJK), combining and escape codes.
+ASCII = 'abcdefghij /.-_0123456789'
+WIDE = '漢字中文日本語한국어ＡＢ'
+COMBINING = '̧́̈'
+ESCAPES = ['\x1b[0m', '\x1b[1;31m', '\x1b[1;34m', '\x1b[0;36m', '\x1b[1;37;46m', '\x1b[K']
+
+def random_status(rng):
+    pieces = []
+    for _ in range(rng.randrange(0, 60)):
+        kind = rng.random()
+        if kind < 0.5:
+            pieces.append(rng.choice(ASCII))
+        elif kind < 0.7:
+            pieces.append(rng.choice(WIDE))
+        elif kind < 0.8 and pieces and pieces[-1][0] != '\x1b':
+            pieces.append(rng.choice(COMBINING)) # after a character it combines with
+        else:
+            pieces.append(rng.choice(ESCAPES))
+    return ''.join(pieces)
+
+def visible(text):
+    return ''.join(ansi_escape_split_re.split(text)[::2])
+
+def test_elide_middle_properties():
+    rng = random.Random(1234)
+    for _ in range(5000):
+        status = random_status(rng)
+        width = rng.randrange(2, 50)
+        elided = elide_middle(status, width)
+
+        assert text_width(visible(elided)) <= width, (status, width, elided)
+        assert ansi_escape_split_re.findall(elided) == ansi_escape_split_re.findall(status)
+        if elided == status:
+            continue
+        head, ellipsis, tail = visible(elided).partition('…')
+        assert ellipsis == '…'
+        original = visible(status)
+        assert original.startswith(head)
+        assert original.endswith(tail)
+        assert len(head) + len(tail) < len(original)
+
+def test_elide_middle_keeps_short_lines():
+    assert elide_middle('short', 10) == 'short'
+    assert elide_middle('\x1b[1;31mshort\x1b[0m', 6) == '\x1b[1;31mshort\x1b[0m'
+    assert elide_middle('anything', 0) == 'anything' # terminal width unknown
+
+def test_elide_middle_counts_wide_characters():
+    elided = elide_middle('漢字漢字漢字漢字', 9)
+    assert text_width(elided) <= 9
+    assert elided.startswith('漢字') and elided.endswith('漢字')
+
+def test_failure_keeps_trace_open_until_build_stopped():
+    out = TraceOutput()
+    native = NinjaNativeFrontend(trace=TraceWriter(out))
+    native.handle(total_edges(2))
+    native.handle(build_started(2))
+    native.handle(edge_started(0, 0))
+    native.handle(edge_started(1, 0))
+    assert native.handle(edge_finished(0, 10, 1, 'error: expected\n'))
+    # ninja still reports the jobs which were running when the first one failed:
+    assert not native.handle(edge_finished(1, 20))
+    assert not out.closed
+    native.build_stopped()
+    events = json.loads(out.final_value)
+    assert sorted(event['name'] for event in events if event['ph'] == 'X') == \
+        ['Building 0.o', 'Building 1.o']
+
+def test_status_lines_held_back_are_not_formatted(monkeypatch, capsys):
+    native = NinjaNativeFrontend(refresh_rate=1)
+    native.printer.smart_terminal = True
+    calls = []
+    original = native.remaining_millis
+    monkeypatch.setattr(native, 'remaining_millis', lambda: calls.append(1) or original())
+    native.handle(total_edges(10))
+    native.handle(build_started(2))
+    for edge_id in range(10):
+        native.handle(edge_started(edge_id, 0))
+    assert len(calls) == 1 # only the first status line has been drawn
+    native.printer.flush()
+    assert len(calls) == 2
+    assert capsys.readouterr().out.endswith('Building 9.o\x1b[0m\x1b[K')
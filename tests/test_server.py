@@ -0,0 +1,30 @@
+import os
+import socket
+import sys
+
+import pytest
+
+from ja import client, server
+
+def send_request(sock, request):
+    """Sends request like run_in_server does, with a pipe in place of the terminal."""
+    read_fd, write_fd = os.pipe()
+    try:
+        fds = b''.join(fd.to_bytes(4, sys.byteorder) for fd in (read_fd, write_fd, write_fd))
+        sock.sendmsg([request[:1]], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+        sock.sendall(request[1:])
+        sock.shutdown(socket.SHUT_WR)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+def test_rejects_client_with_other_code(monkeypatch):
+    monkeypatch.setattr(os, 'fork', lambda: pytest.fail('forked for a client with other code'))
+    server_sock, client_sock = socket.socketpair()
+    try:
+        send_request(client_sock, client.encode_request(['--version']))
+        server.handle(server_sock, client.code_version() + b',other')
+        server_sock.close()
+        assert client_sock.recv(64) == b'' # no pid, the client builds in-process
+    finally:
+        client_sock.close()
@@ -0,0 +1,89 @@
+import json
+import os
+
+from ja.sources import map_sources
+
+# Written by CMake 3.25 with -G 'Ninja Multi-Config' -DCMAKE_CONFIGURATION_TYPES='Debug;Release'
+# for a library util and an executable app, build directory /tmp/mc/build:
+MULTI_CONFIG_COMMANDS = [
+    {
+        'directory': '/tmp/mc/build',
+        'command': '/usr/bin/c++ -DCMAKE_INTDIR=\\"Debug\\" -g -o '
+                   'CMakeFiles/util.dir/Debug/src/util.cpp.o -c /tmp/mc/src/util.cpp',
+        'file': '/tmp/mc/src/util.cpp',
+    },
+    {
+        'directory': '/tmp/mc/build',
+        'command': '/usr/bin/c++ -DCMAKE_INTDIR=\\"Release\\" -O3 -DNDEBUG -o '
+                   'CMakeFiles/util.dir/Release/src/util.cpp.o -c /tmp/mc/src/util.cpp',
+        'file': '/tmp/mc/src/util.cpp',
+    },
+    {
+        'directory': '/tmp/mc/build',
+        'command': '/usr/bin/c++ -DCMAKE_INTDIR=\\"Debug\\" -g -o '
+                   'CMakeFiles/app.dir/Debug/src/main.cpp.o -c /tmp/mc/src/main.cpp',
+        'file': '/tmp/mc/src/main.cpp',
+    },
+    {
+        'directory': '/tmp/mc/build',
+        'command': '/usr/bin/c++ -DCMAKE_INTDIR=\\"Release\\" -O3 -DNDEBUG -o '
+                   'CMakeFiles/app.dir/Release/src/main.cpp.o -c /tmp/mc/src/main.cpp',
+        'file': '/tmp/mc/src/main.cpp',
+    },
+]
+
+# The beginning of the build files of the same build directory:
+BUILD_FILES = {
+    'build.ninja': "# Build using rules for 'Debug'.\n\ninclude CMakeFiles/impl-Debug.ninja\n",
+    'build-Debug.ninja': '# This file contains aliases specific to the "Debug"\n# configuration.'
+                         '\n\ninclude CMakeFiles/impl-Debug.ninja\n',
+    'build-Release.ninja': '# This file contains aliases specific to the "Release"\n'
+                           '# configuration.\n\ninclude CMakeFiles/impl-Release.ninja\n',
+}
+
+def write_build_dir(tmp_path, commands, build_files):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'util.cpp').write_text('int util() { return 1; }\n')
+    (src / 'main.cpp').write_text('int util(); int main() { return util(); }\n')
+    build = tmp_path / 'build'
+    build.mkdir()
+    text = json.dumps(commands).replace('/tmp/mc', str(tmp_path))
+    (build / 'compile_commands.json').write_text(text)
+    for name, content in build_files.items():
+        (build / name).write_text(content)
+    return {'main.cpp': os.path.realpath(str(src / 'main.cpp')),
+            'util.cpp': os.path.realpath(str(src / 'util.cpp'))}
+
+def test_multi_config_maps_to_objects_of_the_build_file(tmp_path, monkeypatch):
+    source_paths = write_build_dir(tmp_path, MULTI_CONFIG_COMMANDS, BUILD_FILES)
+    monkeypatch.chdir(tmp_path / 'build')
+    assert map_sources(('main.cpp', 'all'), source_paths, 'build.ninja') == \
+        ('CMakeFiles/app.dir/Debug/src/main.cpp.o', 'all')
+    assert map_sources(('util.cpp',), source_paths, 'build-Release.ninja') == \
+        ('CMakeFiles/util.dir/Release/src/util.cpp.o',)
+    # From the cached index:
+    assert os.path.exists('.ja_sources')
+    assert map_sources(('main.cpp',), source_paths, 'build-Release.ninja') == \
+        ('CMakeFiles/app.dir/Release/src/main.cpp.o',)
+
+def test_single_config(tmp_path, monkeypatch):
+    commands = [{
+        'directory': '/tmp/mc/build',
+        'command': '/usr/bin/c++ -g -o CMakeFiles/app.dir/src/main.cpp.o -c /tmp/mc/src/main.cpp',
+        'file': '/tmp/mc/src/main.cpp',
+    }, {
+        # Without -o, e.g. when compile_commands.json comes from another tool:
+        'directory': '/tmp/mc/build',
+        'arguments': ['/usr/bin/c++', '-c', '../src/util.cpp'],
+        'file': '../src/util.cpp',
+    }]
+    source_paths = write_build_dir(tmp_path, commands, {'build.ninja': 'rule cc\n'})
+    monkeypatch.chdir(tmp_path / 'build')
+    assert map_sources(('main.cpp', 'util.cpp'), source_paths, 'build.ninja') == \
+        ('CMakeFiles/app.dir/src/main.cpp.o', '../src/util.cpp^')
+
+def test_without_compile_commands(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert map_sources(('main.cpp',), {'main.cpp': '/src/main.cpp'}, 'build.ninja') == \
+        ('main.cpp',)
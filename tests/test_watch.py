@@ -0,0 +1,30 @@
+import io
+
+from ja import frontend
+from ja.native import NinjaNativeFrontend
+from ja.watch import Watch
+
+from ninja_status import FinishedNinja, encode, two_edges
+
+def build(messages, monkeypatch):
+    """Runs one build of Watch with the status stream of messages, returns how often
+    build_stopped() has been called."""
+    native = NinjaNativeFrontend()
+    stopped = []
+    original = native.build_stopped
+    monkeypatch.setattr(native, 'build_stopped', lambda: stopped.append(1) or original())
+    stream = encode(messages)
+    watch = Watch(native, 'build.ninja', [], FinishedNinja,
+                  lambda idle: frontend.Frontend(io.BytesIO(stream), idle=idle))
+    try:
+        watch.build()
+    finally:
+        watch.inotify.close()
+    return len(stopped)
+
+def test_failed_build_is_stopped_after_its_stream_has_ended(monkeypatch):
+    # ninja doesn't send build_finished after a failure:
+    assert build(two_edges(fail=True, finished=False), monkeypatch) == 1
+
+def test_finished_build_is_stopped_once(monkeypatch):
+    assert build(two_edges(fail=False), monkeypatch) == 1